@@ -1,9 +1,11 @@
 #!/usr/bin/python
 
 from collections import defaultdict
+from functools import lru_cache
 from typing import Any, Dict, List, Set, Tuple, Union, Optional
 import json
 import argparse
+import itertools
 import string
 import re
 
@@ -41,6 +43,13 @@ def _tokenize(text: str) -> List[str]:
     return re.split(" |-", text)
 
 
+# The same (mostly gold) strings get normalized over and over again while scoring, so
+# normalization is memoized by the raw string. Bounded so that it can't grow unboundedly
+# in long-running processes.
+NORMALIZATION_CACHE_SIZE = 2**18
+
+
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
 def _normalize_answer(text: str) -> str:
     """Lower text and remove punctuation, articles and extra whitespace."""
 
@@ -55,6 +64,7 @@ def _normalize_answer(text: str) -> str:
     return normalized
 
 
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
 def _is_number(text: str) -> bool:
     try:
         float(text)
@@ -86,19 +96,62 @@ def _answer_to_bags(
     return normalized_spans, token_bags
 
 
+# Alignments with at most these many bags on either side are found by trying all of them.
+MAX_BRUTE_FORCE_ALIGNMENT_SIZE = 3
+
+
 def _align_bags(predicted: List[Set[str]], gold: List[Set[str]]) -> List[float]:
     """
     Takes gold and predicted answer sets and first finds the optimal 1-1 alignment
     between them and gets maximum metric values over all the answers.
     """
-    scores = np.zeros([len(gold), len(predicted)])
-    for gold_index, gold_item in enumerate(gold):
-        for pred_index, pred_item in enumerate(predicted):
-            if _match_numbers_if_present(gold_item, pred_item):
-                scores[gold_index, pred_index] = _compute_f1(pred_item, gold_item)
+    scores = [
+        [
+            _compute_f1(pred_item, gold_item)
+            if _match_numbers_if_present(gold_item, pred_item)
+            else 0.0
+            for pred_item in predicted
+        ]
+        for gold_item in gold
+    ]
+    num_gold, num_predicted = len(gold), len(predicted)
+    max_scores = [0.0] * max(num_gold, num_predicted)
+    if not num_gold or not num_predicted:
+        return max_scores
+
+    # Almost always, there's a single gold and/or a single predicted bag, and then
+    # the optimal alignment is just the best scoring pair.
+    if num_gold == 1:
+        max_scores[0] = max(scores[0])
+    elif num_predicted == 1:
+        column = [row_scores[0] for row_scores in scores]
+        best_score = max(column)
+        max_scores[column.index(best_score)] = best_score
+    elif max(num_gold, num_predicted) <= MAX_BRUTE_FORCE_ALIGNMENT_SIZE:
+        best_total, best_pairs = -1.0, None
+        if num_gold <= num_predicted:
+            for columns in itertools.permutations(range(num_predicted), num_gold):
+                pairs = list(enumerate(columns))
+                total = sum(scores[row][column] for row, column in pairs)
+                if total > best_total:
+                    best_total, best_pairs = total, pairs
+        else:
+            for rows in itertools.permutations(range(num_gold), num_predicted):
+                pairs = [(row, column) for column, row in enumerate(rows)]
+                total = sum(scores[row][column] for row, column in pairs)
+                if total > best_total:
+                    best_total, best_pairs = total, pairs
+        for row, column in best_pairs:
+            max_scores[row] = scores[row][column]
+    else:
+        return _align_bags_with_linear_sum_assignment(np.array(scores))
+    return max_scores
+
+
+def _align_bags_with_linear_sum_assignment(scores: np.ndarray) -> List[float]:
     row_ind, col_ind = linear_sum_assignment(-scores)
 
-    max_scores = np.zeros([max(len(gold), len(predicted))])
+    max_scores = np.zeros([max(scores.shape)])
     for row, column in zip(row_ind, col_ind):
         max_scores[row] = max(max_scores[row], scores[row, column])
     return max_scores
@@ -0,0 +1,119 @@
+# Checks that _align_bags (with its fast paths) gives the same scores as the original
+# (always Hungarian) implementation on answers of all the processed datasets, and times both.
+import os
+import glob
+import sys
+import time
+import argparse
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from lib import read_jsonl
+from allennlp_lib.tools.drop import (
+    _align_bags,
+    _answer_to_bags,
+    _compute_f1,
+    _match_numbers_if_present,
+    answer_json_to_strings,
+)
+
+
+def original_align_bags(predicted: List[Set[str]], gold: List[Set[str]]) -> List[float]:
+    # _align_bags as it was before the fast paths were added.
+    scores = np.zeros([len(gold), len(predicted)])
+    for gold_index, gold_item in enumerate(gold):
+        for pred_index, pred_item in enumerate(predicted):
+            if _match_numbers_if_present(gold_item, pred_item):
+                scores[gold_index, pred_index] = _compute_f1(pred_item, gold_item)
+    row_ind, col_ind = linear_sum_assignment(-scores)
+
+    max_scores = np.zeros([max(len(gold), len(predicted))])
+    for row, column in zip(row_ind, col_ind):
+        max_scores[row] = max(max_scores[row], scores[row, column])
+    return max_scores
+
+
+def get_all_answer_texts(instance: Dict) -> List[Tuple[str, ...]]:
+    if "answers_objects" in instance:
+        return [
+            answer_json_to_strings(answer_object)[0]
+            for answer_object in instance["answers_objects"]
+        ]
+    if "answers" in instance:
+        return [(answer,) for answer in instance["answers"]]
+    if "answer_list" in instance:
+        return [tuple(instance["answer_list"])]
+    if "all_answer_texts" in instance:
+        return [tuple(answer_texts) for answer_texts in instance["all_answer_texts"]]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check parity and time _align_bags against the original implementation."
+    )
+    parser.add_argument(
+        "--processed_data_directory",
+        type=str,
+        default="processed_target_datasets",
+        help="directory with the processed datasets.",
+    )
+    args = parser.parse_args()
+
+    file_paths = sorted(
+        glob.glob(
+            os.path.join(args.processed_data_directory, "**", "*.jsonl"), recursive=True
+        )
+    )
+    if not file_paths:
+        sys.exit(f"No processed datasets found in {args.processed_data_directory}.")
+
+    # Each answer is aligned with the other answers of its instance and with the first
+    # answer of the next instance, which covers both (partial) matches and mismatches.
+    bag_pairs = []
+    for file_path in file_paths:
+        all_answer_texts = [
+            get_all_answer_texts(instance) for instance in read_jsonl(file_path)
+        ]
+        all_answer_texts = [answer_texts for answer_texts in all_answer_texts if answer_texts]
+        for index, answer_texts in enumerate(all_answer_texts):
+            next_answer_texts = all_answer_texts[(index + 1) % len(all_answer_texts)]
+            for predicted in answer_texts:
+                for gold in answer_texts + next_answer_texts[:1]:
+                    bag_pairs.append((_answer_to_bags(predicted)[1], _answer_to_bags(gold)[1]))
+    print(f"Aligning {len(bag_pairs)} predicted/gold bag pairs from {len(file_paths)} files.")
+
+    seconds = {}
+    all_max_scores = {}
+    for name, align_bags in (("original", original_align_bags), ("fast", _align_bags)):
+        start_time = time.perf_counter()
+        all_max_scores[name] = [align_bags(predicted, gold) for predicted, gold in bag_pairs]
+        seconds[name] = time.perf_counter() - start_time
+        print(f"{name}: {seconds[name] * 1e6 / len(bag_pairs):.2f} µs per alignment")
+
+    num_multi_span = 0
+    for (predicted, gold), original_max_scores, max_scores in zip(
+        bag_pairs, all_max_scores["original"], all_max_scores["fast"]
+    ):
+        num_multi_span += len(predicted) > 1 and len(gold) > 1
+        # Equally optimal alignments may score individual bags differently, but they
+        # must give the same F1 (as computed in get_metrics).
+        if len(original_max_scores) != len(max_scores) or (
+            len(max_scores)
+            and round(np.mean(original_max_scores), 2) != round(np.mean(max_scores), 2)
+        ):
+            raise Exception(
+                f"Mismatch for predicted {predicted} and gold {gold}: "
+                f"{list(original_max_scores)} (original) vs {list(max_scores)} (fast)."
+            )
+
+    print(
+        f"All alignments match ({num_multi_span} with multiple bags on both sides). "
+        f"Speedup: {seconds['original'] / seconds['fast']:.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Checks that the fast tokenizers with digit tokenization give the same token ids and
+# decoded texts as the slow ones on all the processed target datasets, and times both.
+import os
+import glob
+import time
+import argparse
+
+from lib import read_jsonl
+from predict import load_tokenizer, prepare_input_text
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check parity of slow and fast tokenizers with digit tokenization."
+    )
+    parser.add_argument(
+        "hf_model_names_or_paths", type=str, nargs="+", help="hf_model_names_or_paths"
+    )
+    parser.add_argument(
+        "--processed_data_directory",
+        type=str,
+        help="processed_data_directory",
+        default="processed_target_datasets",
+    )
+    parser.add_argument(
+        "--max_instances_per_file",
+        type=int,
+        help="max_instances_per_file",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    file_paths = sorted(
+        glob.glob(
+            os.path.join(args.processed_data_directory, "**", "*.jsonl"), recursive=True
+        )
+    )
+    if not file_paths:
+        raise Exception(f"No processed files found in {args.processed_data_directory}.")
+
+    num_mismatches = 0
+    for hf_model_name_or_path in args.hf_model_names_or_paths:
+        print(f"\n\nWorking on {hf_model_name_or_path}.")
+        slow_tokenizer = load_tokenizer(hf_model_name_or_path, use_fast=False)
+        fast_tokenizer = load_tokenizer(hf_model_name_or_path, use_fast=True)
+
+        for file_path in file_paths:
+            instances = read_jsonl(file_path)[: args.max_instances_per_file]
+            input_texts = [
+                prepare_input_text(
+                    slow_tokenizer, instance["question_text"], instance["context_text"]
+                )
+                for instance in instances
+            ]
+
+            tokenizer_to_seconds = {}
+            tokenizer_to_input_ids = {}
+            tokenizer_to_decoded_texts = {}
+            for name, tokenizer in (("slow", slow_tokenizer), ("fast", fast_tokenizer)):
+                start_time = time.time()
+                input_ids = tokenizer(
+                    input_texts, truncation=True, max_length=800, add_special_tokens=True
+                )["input_ids"]
+                tokenizer_to_seconds[name] = time.time() - start_time
+                tokenizer_to_input_ids[name] = input_ids
+                tokenizer_to_decoded_texts[name] = [
+                    tokenizer.fix_decoded_text(decoded_text)
+                    for decoded_text in tokenizer.batch_decode(
+                        input_ids, skip_special_tokens=False
+                    )
+                ]
+
+            num_ids_mismatches = sum(
+                slow_input_ids != fast_input_ids
+                for slow_input_ids, fast_input_ids in zip(
+                    tokenizer_to_input_ids["slow"], tokenizer_to_input_ids["fast"]
+                )
+            )
+            num_text_mismatches = sum(
+                slow_text != fast_text
+                for slow_text, fast_text in zip(
+                    tokenizer_to_decoded_texts["slow"], tokenizer_to_decoded_texts["fast"]
+                )
+            )
+            num_mismatches += num_ids_mismatches + num_text_mismatches
+            speedup = tokenizer_to_seconds["slow"] / max(tokenizer_to_seconds["fast"], 1e-6)
+            print(
+                f"{file_path}: {len(instances)} instances, "
+                f"{num_ids_mismatches} token ids mismatches, "
+                f"{num_text_mismatches} decoded text mismatches, "
+                f"slow {round(tokenizer_to_seconds['slow'], 2)}s, "
+                f"fast {round(tokenizer_to_seconds['fast'], 2)}s ({round(speedup, 1)}x)."
+            )
+
+    if num_mismatches:
+        raise Exception(f"Found {num_mismatches} mismatches between slow and fast tokenizers.")
+    print("\nThe slow and fast tokenizers match on all the files.")
+
+
+if __name__ == "__main__":
+    main()
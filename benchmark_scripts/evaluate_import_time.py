@@ -0,0 +1,64 @@
+# Reports the cold import time of evaluate.py (via python -X importtime) against the
+# time it took to import the metrics through allennlp, and the slowest imported modules.
+import re
+import argparse
+import subprocess
+import sys
+from typing import List, Tuple
+
+IMPORT_STATEMENTS = {
+    "evaluate": "import evaluate",
+    "allennlp (before)": (
+        "from allennlp.common.util import import_module_and_submodules; "
+        "import_module_and_submodules('allennlp_lib')"
+    ),
+}
+
+IMPORT_TIME_REGEX = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)$")
+
+
+def get_import_times(statement: str) -> List[Tuple[int, int, str]]:
+    # Returns (cumulative microseconds, depth, name) of each imported module.
+    completed_process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if completed_process.returncode != 0:
+        return None
+    import_times = []
+    for line in completed_process.stderr.splitlines():
+        match = IMPORT_TIME_REGEX.match(line)
+        if match:
+            import_times.append(
+                (int(match.group(1)), len(match.group(2)) // 2, match.group(3))
+            )
+    return import_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of evaluate.py.")
+    parser.add_argument(
+        "--num_slowest", type=int, default=10, help="number of slowest top-level imports to show."
+    )
+    args = parser.parse_args()
+
+    for name, statement in IMPORT_STATEMENTS.items():
+        import_times = get_import_times(statement)
+        if import_times is None:
+            print(f"{name}: couldn't be imported (is it installed?).\n")
+            continue
+        top_level_import_times = [
+            (cumulative_us, module) for cumulative_us, depth, module in import_times if depth == 0
+        ]
+        total_seconds = sum(cumulative_us for cumulative_us, _ in top_level_import_times) / 1e6
+        print(f"{name}: {total_seconds:.2f}s to import {len(import_times)} modules.")
+        for cumulative_us, module in sorted(top_level_import_times, reverse=True)[
+            : args.num_slowest
+        ]:
+            print(f"    {cumulative_us / 1e6:.3f}s {module}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Times fix_decoded_text per string against the original (uncompiled, sequential)
+# implementation on real predictions, and checks that the outputs are byte-identical.
+import os
+import re
+import glob
+import time
+import argparse
+from typing import List
+
+from lib import read_jsonl
+from predict import load_tokenizer
+
+
+def original_fix_decoded_text(tokenizer, decoded_text: str) -> str:
+    # fix_decoded_text as it was before the regexes were precompiled.
+    fixed_decoded_text = decoded_text
+    for special_token in tokenizer._added_tokens:
+        fixed_decoded_text = fixed_decoded_text.replace(
+            special_token, " " + special_token + " "
+        )
+    if tokenizer._bos_token:
+        fixed_decoded_text = fixed_decoded_text.replace(tokenizer.bos_token, "")
+    fixed_decoded_text = fixed_decoded_text.replace(tokenizer.eos_token, "")
+    fixed_decoded_text = fixed_decoded_text.replace(tokenizer.pad_token, "")
+    fixed_decoded_text = " ".join(re.split(r" +", fixed_decoded_text)).strip()
+    fixed_decoded_text = re.sub(r" +", " ", fixed_decoded_text).strip()
+
+    ### For bart:
+    fixed_decoded_text = re.sub(r"(\d)(\D)", r"\1 \2", fixed_decoded_text)
+    fixed_decoded_text = re.sub(r"([a-zA-Z])(\d)", r"\1 \2", fixed_decoded_text)
+    fixed_decoded_text = re.sub(r" ,(\d\d\d)(\D)", r",\1\2", fixed_decoded_text)
+    fixed_decoded_text = re.sub(r" ,(\d\d\d)\b", r",\1", fixed_decoded_text)
+    fixed_decoded_text = re.sub(r"(\d) ,(\d)", r"\1, \2", fixed_decoded_text)
+    fixed_decoded_text = re.sub(r"(\d) , ", r"\1, ", fixed_decoded_text)
+    fixed_decoded_text = re.sub(r" +", " ", fixed_decoded_text)
+    fixed_decoded_text = re.sub(r"(\D),(\d)", r"\1 \2", fixed_decoded_text)
+
+    ### For bart + t5:
+    fixed_decoded_text = re.sub(r", (\d\d\d)(\D)", r",\1\2", fixed_decoded_text)
+    fixed_decoded_text = re.sub(r", (\d\d\d)\b", r",\1", fixed_decoded_text)
+    fixed_decoded_text = re.sub(r"(\d) +([-/.:%;-])", r"\1\2", fixed_decoded_text)
+    fixed_decoded_text = re.sub(r"([-/:%;-]) +(\d)", r"\1\2", fixed_decoded_text)
+    fixed_decoded_text = re.sub(
+        r"(\d) (st|nd|rd|th|ers|°C)", r"\1\2", fixed_decoded_text
+    )
+    fixed_decoded_text = re.sub(r"(\d)(thousand|million)", r"\1 \2", fixed_decoded_text)
+    fixed_decoded_text = re.sub(r"(\([\d,.]+) +\)", r"\1)", fixed_decoded_text)
+    fixed_decoded_text = re.sub(r"(\d+) s\b", r"\1s", fixed_decoded_text)
+    return fixed_decoded_text
+
+
+def time_per_string(function, texts: List[str], num_repeats: int) -> float:
+    start_time = time.perf_counter()
+    for _ in range(num_repeats):
+        for text in texts:
+            function(text)
+    return (time.perf_counter() - start_time) / (num_repeats * len(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark fix_decoded_text on the generated predictions."
+    )
+    parser.add_argument("hf_model_name_or_path", type=str, help="hf_model_name_or_path")
+    parser.add_argument(
+        "--predictions_directory",
+        type=str,
+        help="predictions_directory",
+        default="predictions",
+    )
+    parser.add_argument("--num_repeats", type=int, help="num_repeats", default=5)
+    args = parser.parse_args()
+
+    tokenizer = load_tokenizer(args.hf_model_name_or_path)
+
+    # Re-encode the predicted texts and decode them back (as predict.py does) to get
+    # the raw decoded texts, with the special tokens in them.
+    predicted_texts = [
+        instance["predicted_text"]
+        for file_path in sorted(
+            glob.glob(os.path.join(args.predictions_directory, "*.jsonl"))
+        )
+        for instance in read_jsonl(file_path)
+    ]
+    if not predicted_texts:
+        raise Exception(f"No predictions found in {args.predictions_directory}.")
+    input_ids = tokenizer(predicted_texts, add_special_tokens=True)["input_ids"]
+    decoded_texts = tokenizer.batch_decode(input_ids, skip_special_tokens=False)
+
+    num_mismatches = sum(
+        tokenizer.fix_decoded_text(decoded_text)
+        != original_fix_decoded_text(tokenizer, decoded_text)
+        for decoded_text in decoded_texts
+    )
+
+    original_seconds = time_per_string(
+        lambda text: original_fix_decoded_text(tokenizer, text),
+        decoded_texts,
+        args.num_repeats,
+    )
+    seconds = time_per_string(tokenizer.fix_decoded_text, decoded_texts, args.num_repeats)
+
+    print(f"Number of decoded texts: {len(decoded_texts)}")
+    print(f"Original: {round(original_seconds * 1e6, 2)} microseconds per string.")
+    print(f"Current: {round(seconds * 1e6, 2)} microseconds per string.")
+    print(f"Speedup: {round(original_seconds / seconds, 2)}x")
+    if num_mismatches:
+        raise Exception(f"Found {num_mismatches} outputs that aren't byte-identical.")
+    print("All outputs are byte-identical.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Reports the prediction latency saved by the generation profile of a dataset (see
+# compute_generation_profiles.py) versus the default max length, and the change in EM/F1.
+import copy
+import time
+import argparse
+
+import torch
+from transformers import AutoModelForSeq2SeqLM
+
+from lib import iterate_dataset
+from predict import (
+    DEFAULT_MAX_GENERATION_LENGTH,
+    GENERATION_PROFILES_PATH,
+    add_predicted_answers,
+    generate_predictions,
+    get_max_generation_length,
+    load_tokenizer,
+    prepare_input_ids,
+)
+from evaluate import compute_answer_scores
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the default max generation length with the dataset's profile."
+    )
+    parser.add_argument("hf_model_name_or_path", type=str, help="hf_model_name_or_path")
+    parser.add_argument("evaluation_path", type=str, help="evaluation_path")
+    parser.add_argument("--num_instances", type=int, help="num_instances", default=None)
+    parser.add_argument("--batch_size", type=int, help="batch_size", default=32)
+    parser.add_argument(
+        "--generation_profiles_path",
+        type=str,
+        help="generation_profiles_path",
+        default=GENERATION_PROFILES_PATH,
+    )
+    args = parser.parse_args()
+
+    instances = list(iterate_dataset(args.evaluation_path))[: args.num_instances]
+    tokenizer = load_tokenizer(args.hf_model_name_or_path)
+    model = AutoModelForSeq2SeqLM.from_pretrained(args.hf_model_name_or_path)
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    input_ids = prepare_input_ids(tokenizer, instances, 600, 100)
+
+    profile_max_length = get_max_generation_length(
+        tokenizer, args.evaluation_path, args.generation_profiles_path
+    )
+    for name, max_length in (
+        ("default", DEFAULT_MAX_GENERATION_LENGTH),
+        ("profile", profile_max_length),
+    ):
+        start_time = time.perf_counter()
+        predictions = generate_predictions(
+            tokenizer,
+            model,
+            instances,
+            device=device,
+            batch_size=args.batch_size,
+            input_ids=input_ids,
+            max_generation_length=max_length,
+        )
+        seconds = time.perf_counter() - start_time
+        prediction_instances = copy.deepcopy(instances)
+        add_predicted_answers(prediction_instances, predictions)
+        result = compute_answer_scores(prediction_instances)
+        print(
+            f"{name} (max_length={max_length}): {seconds:.1f}s "
+            f"({1000 * seconds / len(instances):.1f}ms per instance), "
+            f"ans_em={result['ans_em']}, ans_f1={result['ans_f1']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
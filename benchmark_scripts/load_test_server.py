@@ -0,0 +1,70 @@
+# Sends concurrent requests (questions of a processed dataset) to a running serve.py,
+# and reports the p50/p99 latency and the throughput.
+import json
+import time
+import argparse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import numpy as np
+
+from lib import iterate_dataset
+
+
+def send_request(url: str, instance: Dict) -> float:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(
+            {
+                "question_text": instance["question_text"],
+                "context_text": instance["context_text"],
+            }
+        ).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    start_time = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        json.loads(response.read())
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test serve.py.")
+    parser.add_argument(
+        "--url", type=str, help="url", default="http://127.0.0.1:8000/predict"
+    )
+    parser.add_argument(
+        "--evaluation_path",
+        type=str,
+        help="evaluation_path",
+        default="processed_target_datasets/drop/dev.jsonl",
+    )
+    parser.add_argument("--num_requests", type=int, help="num_requests", default=500)
+    parser.add_argument(
+        "--concurrency", type=int, help="number of concurrent clients", default=16
+    )
+    args = parser.parse_args()
+
+    instances = list(iterate_dataset(args.evaluation_path))[: args.num_requests]
+
+    # Warm up, so that the first (slower) model calls aren't counted.
+    for instance in instances[: args.concurrency]:
+        send_request(args.url, instance)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        latencies = list(
+            executor.map(lambda instance: send_request(args.url, instance), instances)
+        )
+    seconds = time.perf_counter() - start_time
+
+    latencies_ms = 1000 * np.array(latencies)
+    print(f"{len(instances)} requests with {args.concurrency} concurrent clients:")
+    print(f"p50 latency: {np.percentile(latencies_ms, 50):.1f}ms")
+    print(f"p99 latency: {np.percentile(latencies_ms, 99):.1f}ms")
+    print(f"Throughput: {len(instances) / seconds:.2f} requests/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Times compute_answer_scores on drop_dev predictions with and without the memoized
+# answer normalization, and checks that the metrics are identical.
+import os
+import glob
+import sys
+import time
+import argparse
+
+from lib import read_jsonl
+from allennlp_lib.tools import drop
+from metrics import list_squad_em_and_f1
+from evaluate import compute_answer_scores
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark memoized answer normalization on drop_dev predictions."
+    )
+    parser.add_argument(
+        "--predictions_directory",
+        type=str,
+        default="predictions",
+        help="directory with the {model}__drop_dev.jsonl prediction files.",
+    )
+    args = parser.parse_args()
+
+    prediction_paths = sorted(
+        glob.glob(os.path.join(args.predictions_directory, "*__drop_dev.jsonl"))
+    )
+    if not prediction_paths:
+        sys.exit(f"No drop_dev predictions found in {args.predictions_directory}.")
+    all_prediction_instances = [read_jsonl(path) for path in prediction_paths]
+
+    cached_functions = {
+        "_normalize_answer": drop._normalize_answer,
+        "_is_number": drop._is_number,
+    }
+
+    seconds = {}
+    results = {}
+    for mode in ("uncached", "cached"):
+        for name, cached_function in cached_functions.items():
+            cached_function.cache_clear()
+            function = cached_function.__wrapped__ if mode == "uncached" else cached_function
+            setattr(drop, name, function)
+            if hasattr(list_squad_em_and_f1, name):
+                setattr(list_squad_em_and_f1, name, function)
+
+        start_time = time.perf_counter()
+        results[mode] = [
+            compute_answer_scores(prediction_instances)
+            for prediction_instances in all_prediction_instances
+        ]
+        seconds[mode] = time.perf_counter() - start_time
+        print(f"{mode}: {seconds[mode]:.2f}s for {len(prediction_paths)} prediction files.")
+
+    if results["cached"] != results["uncached"]:
+        raise Exception("The metrics with and without the normalization cache differ.")
+
+    print(f"Metrics match. Speedup: {seconds['uncached'] / seconds['cached']:.2f}x")
+    print(f"_normalize_answer: {drop._normalize_answer.cache_info()}")
+    print(f"_is_number: {drop._is_number.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
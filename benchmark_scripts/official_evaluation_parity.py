@@ -0,0 +1,64 @@
+# Checks that the in-process official evaluation (drop_dev, tatqa_dev) gives exactly the
+# same ans_em/ans_f1 as running the official scripts in a subprocess, and times both.
+import os
+import glob
+import sys
+import time
+import argparse
+
+from lib import read_jsonl
+from evaluate import compute_answer_scores_with_official_scripts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare in-process and subprocess official evaluation."
+    )
+    parser.add_argument(
+        "--predictions_directory",
+        type=str,
+        default="predictions",
+        help="directory with the {model}__{dataset}.jsonl prediction files.",
+    )
+    args = parser.parse_args()
+
+    os.makedirs(".tmp", exist_ok=True)
+    prediction_paths = []
+    for dataset in ("drop_dev", "tatqa_dev"):
+        prediction_paths += sorted(
+            glob.glob(os.path.join(args.predictions_directory, f"*__{dataset}.jsonl"))
+        )
+    if not prediction_paths:
+        sys.exit(f"No drop_dev or tatqa_dev predictions found in {args.predictions_directory}.")
+
+    total_seconds = {"in_process": 0.0, "subprocess": 0.0}
+    for prediction_path in prediction_paths:
+        dataset = prediction_path.replace(".jsonl", "").split("__")[-1]
+        prediction_instances = read_jsonl(prediction_path)
+
+        metrics = {}
+        for mode in ("subprocess", "in_process"):
+            start_time = time.perf_counter()
+            metrics[mode] = compute_answer_scores_with_official_scripts(
+                prediction_instances, dataset, run_in_subprocess=mode == "subprocess"
+            )
+            metrics[mode].pop("data", None)
+            seconds = time.perf_counter() - start_time
+            total_seconds[mode] += seconds
+            print(f"{prediction_path} ({mode}): {metrics[mode]} in {seconds:.2f}s")
+
+        if metrics["in_process"] != metrics["subprocess"]:
+            raise Exception(
+                f"Mismatch for {prediction_path}: {metrics['in_process']} (in-process) "
+                f"vs {metrics['subprocess']} (subprocess)."
+            )
+
+    print(
+        f"All {len(prediction_paths)} prediction files match. "
+        f"Total time: {total_seconds['in_process']:.2f}s in-process, "
+        f"{total_seconds['subprocess']:.2f}s in subprocesses."
+    )
+
+
+if __name__ == "__main__":
+    main()
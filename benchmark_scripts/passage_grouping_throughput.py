@@ -0,0 +1,73 @@
+# Measures the prediction throughput on (a sample of) drop_dev with and without
+# --group_by_passage. The instances are shuffled first, as they would be if they
+# weren't ordered by passage (processed files are, which makes grouping a no-op).
+import time
+import random
+import argparse
+
+import torch
+from transformers import AutoModelForSeq2SeqLM
+
+from lib import iterate_dataset
+from predict import load_tokenizer, prepare_input_ids, generate_predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput gain of batching questions by passage."
+    )
+    parser.add_argument("hf_model_name_or_path", type=str, help="hf_model_name_or_path")
+    parser.add_argument(
+        "--evaluation_path",
+        type=str,
+        help="evaluation_path",
+        default="processed_target_datasets/drop/dev.jsonl",
+    )
+    parser.add_argument("--num_instances", type=int, help="num_instances", default=512)
+    parser.add_argument("--batch_size", type=int, help="batch_size", default=32)
+    parser.add_argument(
+        "--max_tokens_per_batch", type=int, help="max_tokens_per_batch", default=None
+    )
+    args = parser.parse_args()
+
+    instances = list(iterate_dataset(args.evaluation_path))
+    random.Random(13370).shuffle(instances)
+    instances = instances[: args.num_instances]
+
+    tokenizer = load_tokenizer(args.hf_model_name_or_path)
+    model = AutoModelForSeq2SeqLM.from_pretrained(args.hf_model_name_or_path)
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+
+    # Tokenization is done (and timed) separately, to only compare the model's throughput.
+    start_time = time.perf_counter()
+    input_ids = prepare_input_ids(tokenizer, instances, 600, 100)
+    print(f"Tokenization: {time.perf_counter() - start_time:.2f}s")
+
+    predictions = {}
+    for group_by_passage in (False, True):
+        start_time = time.perf_counter()
+        predictions[group_by_passage] = generate_predictions(
+            tokenizer,
+            model,
+            instances,
+            device=device,
+            batch_size=args.batch_size,
+            max_tokens_per_batch=args.max_tokens_per_batch,
+            show_progress=False,
+            input_ids=input_ids,
+            group_by_passage=group_by_passage,
+        )
+        seconds = time.perf_counter() - start_time
+        print(
+            f"group_by_passage={group_by_passage}: {len(instances) / seconds:.2f} instances/s"
+        )
+
+    num_differences = sum(
+        prediction != grouped_prediction
+        for prediction, grouped_prediction in zip(predictions[False], predictions[True])
+    )
+    print(f"{num_differences} predictions differ between the two (due to batch composition).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Checks that get_orders_by_tf_idf (all questions of a document at once) orders the TAT-QA
+# paragraphs exactly as get_order_by_tf_idf (one question at a time) does, and times both.
+import os
+import sys
+import time
+import argparse
+
+from lib import read_json
+from processing_scripts.preprocess_tatqa import get_order_by_tf_idf, get_orders_by_tf_idf
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check parity and time the batched TAT-QA paragraph ranking."
+    )
+    parser.add_argument(
+        "--raw_data_directory",
+        type=str,
+        default=os.path.join("raw_target_datasets", "tatqa"),
+        help="directory with the raw tatqa_dataset_{set_name}.json files.",
+    )
+    args = parser.parse_args()
+
+    documents = []
+    for set_name in ["train", "dev", "test"]:
+        input_filepath = os.path.join(args.raw_data_directory, f"tatqa_dataset_{set_name}.json")
+        if not os.path.exists(input_filepath):
+            print(f"{input_filepath} doesn't exist. So skipping it.")
+            continue
+        for data_object in read_json(input_filepath):
+            order_to_paragraph_texts = {
+                paragraph["order"]: paragraph["text"]
+                for paragraph in data_object["paragraphs"]
+            }
+            question_texts = [question["question"] for question in data_object["questions"]]
+            documents.append((question_texts, order_to_paragraph_texts))
+    if not documents:
+        sys.exit(f"No raw TAT-QA files found in {args.raw_data_directory}.")
+    num_questions = sum(len(question_texts) for question_texts, _ in documents)
+    print(f"Ranking paragraphs for {num_questions} questions of {len(documents)} documents.")
+
+    start_time = time.perf_counter()
+    original_orders = [
+        [
+            get_order_by_tf_idf(question_text, order_to_paragraph_texts)
+            for question_text in question_texts
+        ]
+        for question_texts, order_to_paragraph_texts in documents
+    ]
+    original_seconds = time.perf_counter() - start_time
+    print(f"original: {original_seconds:.2f}s")
+
+    start_time = time.perf_counter()
+    batched_orders = [
+        get_orders_by_tf_idf(question_texts, order_to_paragraph_texts)
+        for question_texts, order_to_paragraph_texts in documents
+    ]
+    batched_seconds = time.perf_counter() - start_time
+    print(f"batched: {batched_seconds:.2f}s")
+
+    num_mismatches = 0
+    for (question_texts, _), document_original_orders, document_batched_orders in zip(
+        documents, original_orders, batched_orders
+    ):
+        for question_text, original_order, batched_order in zip(
+            question_texts, document_original_orders, document_batched_orders
+        ):
+            if original_order != batched_order:
+                num_mismatches += 1
+                print(
+                    f"Mismatch for question {question_text!r}: "
+                    f"{original_order} (original) vs {batched_order} (batched)."
+                )
+    if num_mismatches:
+        raise Exception(f"{num_mismatches} of {num_questions} paragraph orderings differ.")
+
+    print(f"All paragraph orderings match. Speedup: {original_seconds / batched_seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# Computes, for each processed dataset, the gold answer lengths (in target tokens) on its
+# training set and the max generation length that covers (almost) all of them. predict.py
+# then uses these generation profiles instead of the default max length of 50 tokens.
+from typing import Dict, List
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+from lib import iterate_dataset, read_json
+from constants import ANS_DELIMITER
+from predict import (
+    DEFAULT_MAX_GENERATION_LENGTH,
+    GENERATION_PROFILES_PATH,
+    get_tokenizer_fingerprint,
+    load_tokenizer,
+)
+from allennlp_lib.tools.drop import answer_json_to_strings
+
+# Datasets that have no training set use the generation profile of the one they're built from.
+DATASET_TO_TRAINING_DATASET = {
+    "drop_bpb": "drop",
+    "drop_cs": "drop",
+}
+
+
+def get_target_text(instance: Dict) -> str:
+    if "answers_objects" in instance:
+        answer_texts = answer_json_to_strings(instance["answers_objects"][0])[0]
+    elif "answer_list" in instance:
+        answer_texts = instance["answer_list"]
+    elif "answers" in instance:
+        answer_texts = instance["answers"][:1]
+    else:
+        raise Exception("Answer couldn't be determined.")
+    return f" {ANS_DELIMITER} ".join(answer_texts)
+
+
+def compute_target_lengths(tokenizer, file_path: str, batch_size: int = 1000) -> List[int]:
+    target_lengths = []
+    target_texts = [get_target_text(instance) for instance in iterate_dataset(file_path)]
+    for index in tqdm(range(0, len(target_texts), batch_size)):
+        target_ids = tokenizer(
+            target_texts[index : index + batch_size], add_special_tokens=True
+        )["input_ids"]
+        # The generated sequence also starts with the decoder start token.
+        target_lengths.extend(len(ids) + 1 for ids in target_ids)
+    return target_lengths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute generation profiles.")
+    parser.add_argument(
+        "hf_model_names_or_paths",
+        type=str,
+        nargs="+",
+        help="models whose tokenizers to compute the profiles for. Models sharing "
+        "a tokenizer share the profile.",
+    )
+    parser.add_argument(
+        "--processed_data_directory",
+        type=str,
+        help="processed_data_directory",
+        default="processed_target_datasets",
+    )
+    parser.add_argument(
+        "--quantile",
+        type=float,
+        help="quantile of the training target lengths that the max length needs to cover.",
+        default=0.999,
+    )
+    parser.add_argument(
+        "--margin",
+        type=int,
+        help="number of tokens to add on top of the quantile length.",
+        default=2,
+    )
+    parser.add_argument(
+        "--output_path", type=str, help="output_path", default=GENERATION_PROFILES_PATH
+    )
+    args = parser.parse_args()
+
+    generation_profiles = read_json(args.output_path) if os.path.exists(args.output_path) else {}
+
+    dataset_names = sorted(
+        dataset_name
+        for dataset_name in os.listdir(args.processed_data_directory)
+        if os.path.isdir(os.path.join(args.processed_data_directory, dataset_name))
+    )
+    for hf_model_name_or_path in args.hf_model_names_or_paths:
+        tokenizer = load_tokenizer(hf_model_name_or_path)
+        tokenizer_profiles = {}
+        for dataset_name in dataset_names:
+            training_dataset_name = DATASET_TO_TRAINING_DATASET.get(dataset_name, dataset_name)
+            training_file_path = os.path.join(
+                args.processed_data_directory, training_dataset_name, "train.jsonl"
+            )
+            if not os.path.exists(training_file_path):
+                print(f"No training set found for {dataset_name}. So skipping it.")
+                continue
+
+            print(f"Computing target lengths of {training_file_path} with {hf_model_name_or_path}.")
+            target_lengths = compute_target_lengths(tokenizer, training_file_path)
+            quantile_length = int(
+                math.ceil(np.quantile(target_lengths, args.quantile))
+            )
+            tokenizer_profiles[dataset_name] = {
+                "max_length": min(
+                    quantile_length + args.margin, DEFAULT_MAX_GENERATION_LENGTH
+                ),
+                "training_dataset": training_dataset_name,
+                "num_targets": len(target_lengths),
+                "mean_target_length": round(float(np.mean(target_lengths)), 2),
+                "max_target_length": max(target_lengths),
+                "quantile": args.quantile,
+                "quantile_target_length": quantile_length,
+            }
+            print(f"{dataset_name}: {tokenizer_profiles[dataset_name]}")
+        generation_profiles[get_tokenizer_fingerprint(tokenizer)] = tokenizer_profiles
+
+    print(f"Writing generation profiles in {args.output_path}")
+    with open(args.output_path, "w") as file:
+        json.dump(generation_profiles, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
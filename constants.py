@@ -3,6 +3,9 @@ import itertools
 DF_COL_DELIMITER = "[COLD]"
 DF_ROW_DELIMITER = "[ROWD]"
 ANS_DELIMITER = "<ss>" # To keep it consistent with nt5
+PARTIAL_PREDICTIONS_SUFFIX = ".partial" # Predictions are written here till they're complete.
+PREDICTION_TIMING_SUFFIX = ".timing.json" # Replaces .jsonl of the predictions file.
+QUANTIZE_OPTIONS = ("int8", "bf16")
 
 
 EVALUATION_NAME_TO_FILEPATH = {
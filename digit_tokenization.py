@@ -1,40 +1,102 @@
 import re
+import json
 import types
-from typing import List
+from typing import List, Dict, Callable, Optional, Tuple
 
 from transformers import AutoTokenizer
+from transformers.tokenization_utils import AddedToken
+from transformers.models.bart.tokenization_bart import bytes_to_unicode
+
+
+SPIECE_UNDERLINE = "▁"
+BART_BYTE_DECODER = {v: k for k, v in bytes_to_unicode().items()}
+
+
+MULTIPLE_SPACES_REGEX = re.compile(r" +")
+DIGIT_REGEX = re.compile(r"\d")
+
+T5_SPACE_BEFORE_DIGIT_REGEX = re.compile(r"([a-z]|,|-)(\d)")
+T5_HYPHEN_SPACING_REGEX = re.compile(r"(\d|[a-z])( )?(-)( )?(\d|[a-z])")
+
+# Applied in this order by fix_decoded_text. All of them need a digit to match,
+# except the ones in NON_DIGIT_SPACING_RULES.
+DIGIT_SPACING_RULES = [
+    (re.compile(pattern), replacement)
+    for pattern, replacement in [
+        ### For bart:
+        (r"(\d)(\D)", r"\1 \2"),
+        (r"([a-zA-Z])(\d)", r"\1 \2"),
+        (r" ,(\d\d\d)(\D)", r",\1\2"),
+        (r" ,(\d\d\d)\b", r",\1"),
+        (r"(\d) ,(\d)", r"\1, \2"),
+        (r"(\d) , ", r"\1, "),
+        (r" +", " "),
+        (r"(\D),(\d)", r"\1 \2"),
+        ### For bart + t5:
+        (r", (\d\d\d)(\D)", r",\1\2"),
+        (r", (\d\d\d)\b", r",\1"),
+        (r"(\d) +([-/.:%;-])", r"\1\2"),
+        (r"([-/:%;-]) +(\d)", r"\1\2"),
+        (r"(\d) (st|nd|rd|th|ers|°C)", r"\1\2"),
+        (r"(\d)(thousand|million)", r"\1 \2"),
+        (r"(\([\d,.]+) +\)", r"\1)"),
+        (r"(\d+) s\b", r"\1s"),
+    ]
+]
+# [\d,.]+ can match without a digit. The " +" rule can't do anything on a text
+# without digits either, as the spaces are already collapsed by then.
+NON_DIGIT_SPACING_RULES = [DIGIT_SPACING_RULES[-2]]
 
 
 def t5_fix_output_spacing(text: str) -> str:
     # This is mostly taken from NT5's codebase.
-    text = re.sub(r" +", " ", text).strip()
-    match = re.compile(r"([a-z]|,|-)(\d)")
-    text = re.sub(match, r"\1 \2", text)
-    match = re.compile(r"(\d|[a-z])( )?(-)( )?(\d|[a-z])")
-    text = re.sub(match, r"\1\3\5", text)
-    text = re.sub(r" +", " ", text).strip()
+    text = MULTIPLE_SPACES_REGEX.sub(" ", text).strip()
+    text = T5_SPACE_BEFORE_DIGIT_REGEX.sub(r"\1 \2", text)
+    text = T5_HYPHEN_SPACING_REGEX.sub(r"\1\3\5", text)
+    text = MULTIPLE_SPACES_REGEX.sub(" ", text).strip()
     return text
 
 
-def t5_convert_tokens_to_string(self, tokens: List[str]) -> str:
-    """Converts a sequence of tokens (string) in a single string."""
+def _t5_convert_tokens_to_string(
+    self, tokens: List[str], decode_pieces: Callable[[List[str]], str]
+) -> str:
     current_sub_tokens = []
     out_string = ""
     for token in tokens:
         # make sure that special tokens are not decoded using sentencepiece model
         digits = ["0", "1", "2", "3", "4", "5", "6", "7", "8", "9"]
         if token in self.all_special_tokens and token not in digits:
-            out_string += self.sp_model.decode_pieces(current_sub_tokens) + token + " "
+            out_string += decode_pieces(current_sub_tokens) + token + " "
             current_sub_tokens = []
         else:
             current_sub_tokens.append(token)
-    out_string += self.sp_model.decode_pieces(current_sub_tokens)
+    out_string += decode_pieces(current_sub_tokens)
     out_string = t5_fix_output_spacing(out_string)
     return out_string.strip()
 
 
-def bart_convert_tokens_to_string(self, tokens: List[str]) -> str:
+def t5_convert_tokens_to_string(self, tokens: List[str]) -> str:
+    """Converts a sequence of tokens (string) in a single string."""
+    return _t5_convert_tokens_to_string(self, tokens, self.sp_model.decode_pieces)
+
+
+def _t5_fast_decode_pieces(pieces: List[str]) -> str:
+    # What sentencepiece's decode_pieces does for T5's vocabulary (no byte
+    # pieces): ▁ marks a space, and the one added before the text is dropped.
+    text = "".join(pieces).replace(SPIECE_UNDERLINE, " ")
+    if text.startswith(" "):
+        text = text[1:]
+    return text
+
+
+def t5_fast_convert_tokens_to_string(self, tokens: List[str]) -> str:
     """Converts a sequence of tokens (string) in a single string."""
+    return _t5_convert_tokens_to_string(self, tokens, _t5_fast_decode_pieces)
+
+
+def _bart_convert_tokens_to_string(
+    self, tokens: List[str], byte_decoder: Dict[str, int], errors: str
+) -> str:
     digits = ["0", "1", "2", "3", "4", "5", "6", "7", "8", "9"]
     tokens = [
         token + "Ġ"
@@ -43,41 +105,150 @@ def bart_convert_tokens_to_string(self, tokens: List[str]) -> str:
         for token in tokens
     ]
     text = "".join(tokens)
-    text = bytearray([self.byte_decoder[c] for c in text]).decode(
-        "utf-8", errors=self.errors
-    )
+    text = bytearray([byte_decoder[c] for c in text]).decode("utf-8", errors=errors)
     return text
 
 
-def fix_digit_spacing(fixed_decoded_text: str) -> str:
-    # TODO: This is only temporary.
-    ### For bart:
-    fixed_decoded_text = re.sub(r"(\d)(\D)", r"\1 \2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"([a-zA-Z])(\d)", r"\1 \2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r" ,(\d\d\d)(\D)", r",\1\2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r" ,(\d\d\d)\b", r",\1", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"(\d) ,(\d)", r"\1, \2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"(\d) , ", r"\1, ", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r" +", " ", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"(\D),(\d)", r"\1 \2", fixed_decoded_text)
-
-    ### For bart + t5:
-    fixed_decoded_text = re.sub(r", (\d\d\d)(\D)", r",\1\2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r", (\d\d\d)\b", r",\1", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"(\d) +([-/.:%;-])", r"\1\2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"([-/:%;-]) +(\d)", r"\1\2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(
-        r"(\d) (st|nd|rd|th|ers|°C)", r"\1\2", fixed_decoded_text
+def bart_convert_tokens_to_string(self, tokens: List[str]) -> str:
+    """Converts a sequence of tokens (string) in a single string."""
+    return _bart_convert_tokens_to_string(
+        self, tokens, self.byte_decoder, self.errors
     )
-    fixed_decoded_text = re.sub(r"(\d)(thousand|million)", r"\1 \2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"(\([\d,.]+) +\)", r"\1)", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"(\d+) s\b", r"\1s", fixed_decoded_text)
-    return fixed_decoded_text
+
+
+def bart_fast_convert_tokens_to_string(self, tokens: List[str]) -> str:
+    """Converts a sequence of tokens (string) in a single string."""
+    return _bart_convert_tokens_to_string(
+        self, tokens, BART_BYTE_DECODER, "replace"
+    )
+
+
+def _get_added_tokens(tokenizer: AutoTokenizer) -> List[str]:
+    # The tokens added on top of the base vocabulary, in the order of their ids,
+    # i.e., the values of added_tokens_decoder of the slow tokenizer.
+    if not tokenizer.is_fast:
+        return list(tokenizer.added_tokens_decoder.values())
+    base_vocab_size = tokenizer._tokenizer.get_vocab_size(with_added_tokens=False)
+    return [
+        token
+        for token, id_ in sorted(tokenizer.get_added_vocab().items(), key=lambda e: e[1])
+        if id_ >= base_vocab_size
+    ]
+
+
+def _get_strip_table(slow_tokenizer: AutoTokenizer) -> Dict[str, Tuple[bool, bool]]:
+    # Whether the slow tokenizer strips the whitespace on the left and right of each
+    # token it doesn't split. Like its tokenize, it's that of the token if it's an
+    # AddedToken and both sides otherwise.
+    added_special_tokens = {
+        str(token): token
+        for token in slow_tokenizer.all_special_tokens_extended
+        if isinstance(token, AddedToken)
+    }
+    strip_table = {}
+    for token in slow_tokenizer.unique_no_split_tokens:
+        added_special_token = added_special_tokens.get(token, None)
+        if added_special_token is None:
+            strip_table[token] = (True, True)
+        else:
+            strip_table[token] = (added_special_token.lstrip, added_special_token.rstrip)
+    return strip_table
+
+
+def _disable_fast_stripping(
+    tokenizer: AutoTokenizer, strip_table: Dict[str, Tuple[bool, bool]]
+) -> None:
+    # The fast tokenizer strips whitespace around its added tokens by their own flags,
+    # which can differ from the slow tokenizer's. We do the stripping before handing
+    # the text over instead, so it shouldn't strip anything itself.
+    for added_token in json.loads(tokenizer._tokenizer.to_str())["added_tokens"]:
+        if added_token["content"] not in strip_table:
+            continue
+        if not added_token["lstrip"] and not added_token["rstrip"]:
+            continue
+        token = AddedToken(
+            added_token["content"],
+            single_word=added_token["single_word"],
+            lstrip=False,
+            rstrip=False,
+            normalized=added_token["normalized"],
+        )
+        if added_token["special"]:
+            tokenizer._tokenizer.add_special_tokens([token])
+        else:
+            tokenizer._tokenizer.add_tokens([token])
+
+
+def fast_batch_encode_plus(self, batch_text_or_text_pairs, *args, **kwargs):
+    # The fast tokenizer splits the text on the no-split (e.g., digit) tokens just
+    # like the slow one, but doesn't strip the whitespace around them the same way.
+    # So we split and strip it exactly like the slow tokenizer's tokenize before
+    # handing the text over, to get the same token ids as the slow one.
+    def strip_text(text: str) -> str:
+        pieces = self._no_split_tokens_trie.split(text)
+        for index, piece in enumerate(pieces):
+            if piece not in self._strip_table:
+                continue
+            lstrip, rstrip = self._strip_table[piece]
+            if rstrip and index < len(pieces) - 1:
+                pieces[index + 1] = pieces[index + 1].lstrip()
+            if lstrip and index > 0:
+                pieces[index - 1] = pieces[index - 1].rstrip()
+        if self._rstrip_pieces:
+            pieces = [
+                piece if piece in self._strip_table else piece.rstrip() for piece in pieces
+            ]
+        return "".join(pieces)
+
+    if not kwargs.get("is_split_into_words", False):
+        batch_text_or_text_pairs = [
+            strip_text(text_or_text_pair)
+            if isinstance(text_or_text_pair, str)
+            else tuple(strip_text(text) for text in text_or_text_pair)
+            for text_or_text_pair in batch_text_or_text_pairs
+        ]
+    return type(self)._batch_encode_plus(self, batch_text_or_text_pairs, *args, **kwargs)
+
+
+def fast_decode(
+    self,
+    token_ids: List[int],
+    skip_special_tokens: bool = False,
+    clean_up_tokenization_spaces: bool = True,
+    spaces_between_special_tokens: bool = True,
+    **kwargs,
+) -> str:
+    # Same as the slow tokenizer's _decode, so that convert_tokens_to_string
+    # sees the same groups of tokens.
+    if isinstance(token_ids, int):
+        token_ids = [token_ids]
+    filtered_tokens = self.convert_ids_to_tokens(
+        token_ids, skip_special_tokens=skip_special_tokens
+    )
+    sub_texts = []
+    current_sub_text = []
+    for token in filtered_tokens:
+        if token in self._added_tokens:
+            if current_sub_text:
+                sub_texts.append(self.convert_tokens_to_string(current_sub_text))
+                current_sub_text = []
+            sub_texts.append(token)
+        else:
+            current_sub_text.append(token)
+    if current_sub_text:
+        sub_texts.append(self.convert_tokens_to_string(current_sub_text))
+    if spaces_between_special_tokens:
+        text = " ".join(sub_texts)
+    else:
+        text = "".join(sub_texts)
+    if clean_up_tokenization_spaces:
+        text = self.clean_up_tokenization(text)
+    return text
 
 
 def fix_decoded_text(self, decoded_text: str) -> str:
     fixed_decoded_text = decoded_text
-    for special_token in self.added_tokens_decoder.values():
+    for special_token in self._added_tokens:
         fixed_decoded_text = fixed_decoded_text.replace(
             special_token, " " + special_token + " "
         )
@@ -85,37 +256,22 @@ def fix_decoded_text(self, decoded_text: str) -> str:
         fixed_decoded_text = fixed_decoded_text.replace(self.bos_token, "")
     fixed_decoded_text = fixed_decoded_text.replace(self.eos_token, "")
     fixed_decoded_text = fixed_decoded_text.replace(self.pad_token, "")
-    fixed_decoded_text = " ".join(re.split(r" +", fixed_decoded_text)).strip()
-    fixed_decoded_text = re.sub(r" +", " ", fixed_decoded_text).strip()
-
-    ### For bart:
-    fixed_decoded_text = re.sub(r"(\d)(\D)", r"\1 \2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"([a-zA-Z])(\d)", r"\1 \2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r" ,(\d\d\d)(\D)", r",\1\2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r" ,(\d\d\d)\b", r",\1", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"(\d) ,(\d)", r"\1, \2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"(\d) , ", r"\1, ", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r" +", " ", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"(\D),(\d)", r"\1 \2", fixed_decoded_text)
-
-    ### For bart + t5:
-    fixed_decoded_text = re.sub(r", (\d\d\d)(\D)", r",\1\2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r", (\d\d\d)\b", r",\1", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"(\d) +([-/.:%;-])", r"\1\2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"([-/:%;-]) +(\d)", r"\1\2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(
-        r"(\d) (st|nd|rd|th|ers|°C)", r"\1\2", fixed_decoded_text
-    )
-    fixed_decoded_text = re.sub(r"(\d)(thousand|million)", r"\1 \2", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"(\([\d,.]+) +\)", r"\1)", fixed_decoded_text)
-    fixed_decoded_text = re.sub(r"(\d+) s\b", r"\1s", fixed_decoded_text)
-    return fixed_decoded_text
+    fixed_decoded_text = MULTIPLE_SPACES_REGEX.sub(" ", fixed_decoded_text).strip()
 
+    if DIGIT_REGEX.search(fixed_decoded_text):
+        spacing_rules = DIGIT_SPACING_RULES
+    else:
+        spacing_rules = NON_DIGIT_SPACING_RULES
+    for regex, replacement in spacing_rules:
+        fixed_decoded_text = regex.sub(replacement, fixed_decoded_text)
+    return fixed_decoded_text
 
-def enable_digit_tokenization(tokenizer: AutoTokenizer) -> None:
 
-    if tokenizer.is_fast:
-        raise Exception("The monkey patch only works for the slow tokenizer currently.")
+def enable_digit_tokenization(
+    tokenizer: AutoTokenizer, slow_tokenizer: Optional[AutoTokenizer] = None
+) -> None:
+    # A fast tokenizer is made to tokenize like its slow counterpart, slow_tokenizer,
+    # which is loaded from the same path if not given.
 
     is_t5_based = "T5Tokenizer" in str(tokenizer.__class__)
     is_bart_based = "BartTokenizer" in str(tokenizer.__class__)
@@ -126,13 +282,33 @@ def enable_digit_tokenization(tokenizer: AutoTokenizer) -> None:
             f"Found tokenizer of class: {tokenizer.__class__}"
         )
 
-    if is_t5_based:
-        tokenizer.convert_tokens_to_string = types.MethodType(
-            t5_convert_tokens_to_string, tokenizer
-        )
-    elif is_bart_based:
-        tokenizer.convert_tokens_to_string = types.MethodType(
-            bart_convert_tokens_to_string, tokenizer
+    if tokenizer.is_fast:
+        if is_t5_based:
+            convert_tokens_to_string = t5_fast_convert_tokens_to_string
+        elif is_bart_based:
+            convert_tokens_to_string = bart_fast_convert_tokens_to_string
+        if slow_tokenizer is None:
+            slow_tokenizer = tokenizer.slow_tokenizer_class.from_pretrained(
+                tokenizer.name_or_path
+            )
+        tokenizer._strip_table = _get_strip_table(slow_tokenizer)
+        tokenizer._no_split_tokens_trie = slow_tokenizer.tokens_trie
+        _disable_fast_stripping(tokenizer, tokenizer._strip_table)
+        # sentencepiece drops the trailing whitespace of each piece the slow T5
+        # tokenizer encodes, whereas the fast one encodes it as a ▁.
+        tokenizer._rstrip_pieces = is_t5_based
+        tokenizer._batch_encode_plus = types.MethodType(
+            fast_batch_encode_plus, tokenizer
         )
+        tokenizer._decode = types.MethodType(fast_decode, tokenizer)
+    else:
+        if is_t5_based:
+            convert_tokens_to_string = t5_convert_tokens_to_string
+        elif is_bart_based:
+            convert_tokens_to_string = bart_convert_tokens_to_string
 
+    tokenizer.convert_tokens_to_string = types.MethodType(
+        convert_tokens_to_string, tokenizer
+    )
+    tokenizer._added_tokens = tuple(_get_added_tokens(tokenizer))
     tokenizer.fix_decoded_text = types.MethodType(fix_decoded_text, tokenizer)
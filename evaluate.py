@@ -1,24 +1,60 @@
-from typing import List, Dict
+from typing import List, Dict, Any, Tuple
 from collections import Counter, defaultdict
+from functools import lru_cache
+from types import ModuleType
+import importlib
+import hashlib
 import argparse
 import json
+import sys
 import os
 import subprocess
 import uuid
 
-from allennlp.common.util import import_module_and_submodules
-import_module_and_submodules("allennlp_lib")
-from allennlp_lib.training.metrics.list_squad_em_and_f1 import ListSquadEmAndF1
+import numpy as np
+
+from metrics.list_squad_em_and_f1 import ListSquadEmAndF1
 from allennlp_lib.tools.drop import answer_json_to_strings
 
-from lib import read_jsonl
+from lib import hash_file, read_json, iterate_dataset, write_json
 from predictions_to_official_format import (
     predictions_to_drop_format,
+    predictions_to_drop_json,
     predictions_to_tatqa_format,
+    predictions_to_tatqa_json,
 )
 
 
-def compute_answer_scores(prediction_instances: List[Dict]) -> Dict:
+# The em/f1 of an instance are computed by the code of these, so the cached ones are only
+# reused as long as it's unchanged.
+METRIC_CODE_PATHS = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), *path_parts)
+    for path_parts in [
+        ("metrics", "list_squad_em_and_f1.py"),
+        ("allennlp_lib", "tools", "drop.py"),
+    ]
+]
+
+
+@lru_cache(maxsize=None)
+def get_metrics_version() -> str:
+    m = hashlib.blake2b(digest_size=16)
+    for code_path in METRIC_CODE_PATHS:
+        m.update(hash_file(code_path).encode("utf-8"))
+    return m.hexdigest()
+
+
+def hash_answers(predicted_answers: List[str], all_answer_texts: List[Tuple[str, ...]]) -> str:
+    serialized = json.dumps([predicted_answers, all_answer_texts], ensure_ascii=False)
+    return hashlib.blake2b(serialized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def compute_answer_scores(
+    prediction_instances: List[Dict], score_cache: Dict[str, List] = None
+) -> Dict:
+    # If score_cache (question_id -> [answers hash, em, f1]) is given, only the instances whose
+    # predicted or gold answers aren't in it are scored, and it's updated in place to have
+    # exactly the instances of prediction_instances.
 
     answer_text_metrics = defaultdict(lambda: ListSquadEmAndF1(keep_whitespace=True))
 
@@ -32,6 +68,15 @@ def compute_answer_scores(prediction_instances: List[Dict]) -> Dict:
 
     category_counter = Counter()
 
+    # Each instance is scored once, and its scores are then added to the metric
+    # of each of its categories.
+    batch_predicted_answers = []
+    batch_all_answer_texts = []
+    batch_cache_keys = []
+    all_key_tuples_and_scores = []  # Kept in order, so that the sums don't change with caching.
+    num_cached_scores = 0
+    cache_keys = set()
+
     for instance in prediction_instances:
 
         answer_type = instance.get("answer_type", None)
@@ -103,10 +148,45 @@ def compute_answer_scores(prediction_instances: List[Dict]) -> Dict:
         ]
 
         for key_tuple in key_tuples:
-            if predicted_answers is not None:
-                answer_text_metrics[key_tuple](predicted_answers, all_answer_texts)
             category_counter[key_tuple] += 1
 
+        if predicted_answers is None:
+            continue
+
+        if score_cache is not None:
+            cache_key = str(instance["question_id"])
+            answers_hash = hash_answers(predicted_answers, all_answer_texts)
+            cache_keys.add(cache_key)
+            cache_entry = score_cache.get(cache_key)
+            if cache_entry is not None and cache_entry[0] == answers_hash:
+                all_key_tuples_and_scores.append((key_tuples, cache_entry[1:]))
+                num_cached_scores += 1
+                continue
+            batch_cache_keys.append((cache_key, answers_hash))
+
+        batch_predicted_answers.append(predicted_answers)
+        batch_all_answer_texts.append(all_answer_texts)
+        all_key_tuples_and_scores.append((key_tuples, None))
+
+    batch_scores = ListSquadEmAndF1(keep_whitespace=True).score_batch(
+        batch_predicted_answers, batch_all_answer_texts
+    )
+    remaining_batch_scores = iter(batch_scores)
+    for key_tuples, scores in all_key_tuples_and_scores:
+        em, f1 = next(remaining_batch_scores) if scores is None else scores
+        for key_tuple in key_tuples:
+            answer_text_metrics[key_tuple].add_scores(em, f1)
+
+    if score_cache is not None:
+        for (cache_key, answers_hash), (em, f1) in zip(batch_cache_keys, batch_scores):
+            score_cache[cache_key] = [answers_hash, em, f1]
+        for cache_key in set(score_cache.keys()) - cache_keys:
+            del score_cache[cache_key]
+        print(
+            f"Scored {len(batch_scores)} new or changed instances, "
+            f"reused the scores of {num_cached_scores}."
+        )
+
     all_key_tuples = (
         sorted(categories_overall, key=lambda e: e[1]) +
         sorted(categories_num_steps, key=lambda e: e[1]) +
@@ -137,48 +217,138 @@ def compute_answer_scores(prediction_instances: List[Dict]) -> Dict:
     return result
 
 
-def compute_answer_scores_with_official_scripts(
+OFFICIAL_EVALUATION_SCRIPTS_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "official_evaluation_scripts"
+)
+DATASET_TO_OFFICIAL_GOLD_PATH = {
+    "drop_dev": "raw_target_datasets/drop/drop_dataset_dev.json",
+    "tatqa_dev": "raw_target_datasets/tatqa/tatqa_dataset_dev.json",
+}
+
+
+def import_official_evaluation_script(script_name: str) -> ModuleType:
+    # The official scripts import each other as top-level modules.
+    if OFFICIAL_EVALUATION_SCRIPTS_DIRECTORY not in sys.path:
+        sys.path.append(OFFICIAL_EVALUATION_SCRIPTS_DIRECTORY)
+    return importlib.import_module(script_name)
+
+
+@lru_cache(maxsize=None)
+def load_official_gold_annotations(gold_path: str) -> Any:
+    # Cached across calls, so it's only parsed once per process. It must not be mutated.
+    return read_json(gold_path)
+
+
+def run_official_evaluation_script_in_subprocess(
     original_prediction_instances: List[Dict], dataset: str
 ) -> Dict:
+    # The original way of running the official evaluation, kept to validate
+    # that the in-process evaluation gives exactly the same numbers.
     official_prediction_path = os.path.join(".tmp", uuid.uuid4().hex + ".txt")
     official_metrics_path = os.path.join(".tmp", uuid.uuid4().hex + ".txt")
+    gold_path = DATASET_TO_OFFICIAL_GOLD_PATH[dataset]
 
-    metrics = {}
     if dataset == "drop_dev":
         predictions_to_drop_format(
             original_prediction_instances, official_prediction_path
         )
-
         run_command = (
             f"python official_evaluation_scripts/drop_eval.py "
-            f"--gold_path raw_target_datasets/drop/drop_dataset_dev.json "
+            f"--gold_path {gold_path} "
             f"--prediction_path {official_prediction_path} "
             f"--output_path {official_metrics_path}"
         )
-        subprocess.run(run_command.split())
-
-        with open(official_metrics_path) as file:
-            metrics = json.loads(file.read())
-            metrics["ans_em"] = round(metrics.pop("global_em") * 100, 1)
-            metrics["ans_f1"] = round(metrics.pop("global_f1") * 100, 1)
-
     elif dataset == "tatqa_dev":
         predictions_to_tatqa_format(
             original_prediction_instances, official_prediction_path
         )
-
         run_command = (
             f"python official_evaluation_scripts/tatqa_eval.py "
-            f"--gold_path raw_target_datasets/tatqa/tatqa_dataset_dev.json "
+            f"--gold_path {gold_path} "
             f"--pred_path {official_prediction_path} "
             f"--output_path {official_metrics_path}"
         )
-        subprocess.run(run_command.split())
+    subprocess.run(run_command.split())
+
+    with open(official_metrics_path) as file:
+        metrics = json.loads(file.read())
+    return metrics
+
+
+def run_official_evaluation_in_process(
+    original_prediction_instances: List[Dict], dataset: str
+) -> Dict:
+    gold_annotations = load_official_gold_annotations(
+        DATASET_TO_OFFICIAL_GOLD_PATH[dataset]
+    )
+    data = {
+        "category": [],
+        "subcategory": [],
+        "answer_em": [],
+        "answer_f1": [],
+        "counts": [],
+    }
+
+    if dataset == "drop_dev":
+        drop_eval = import_official_evaluation_script("drop_eval")
+        global_em, global_f1, type_to_em, type_to_f1 = (
+            drop_eval.evaluate_json_with_type_scores(
+                gold_annotations,
+                predictions_to_drop_json(original_prediction_instances),
+            )
+        )
+        for answer_type in sorted(type_to_em.keys()):
+            data["category"].append("answer_type")
+            data["subcategory"].append(answer_type)
+            data["answer_em"].append(round(float(np.mean(type_to_em[answer_type])), 3))
+            data["answer_f1"].append(round(float(np.mean(type_to_f1[answer_type])), 3))
+            data["counts"].append(len(type_to_em[answer_type]))
+
+    elif dataset == "tatqa_dev":
+        tatqa_eval = import_official_evaluation_script("tatqa_eval")
+        global_em, global_f1, detail_em, detail_f1, detail_raw = (
+            tatqa_eval.evaluate_json_with_detail_scores(
+                gold_annotations,
+                predictions_to_tatqa_json(original_prediction_instances),
+            )
+        )
+        for (_, answer_from), answer_type_to_em in detail_em.items():
+            for answer_type, answer_em in answer_type_to_em.items():
+                count = int(detail_raw[("em", answer_from)][answer_type])
+                if not count:
+                    continue
+                data["category"].append("answer_type__answer_from")
+                data["subcategory"].append(f"{answer_type}__{answer_from}")
+                data["answer_em"].append(round(float(answer_em), 3))
+                data["answer_f1"].append(
+                    round(float(detail_f1[("f1", answer_from)][answer_type]), 3)
+                )
+                data["counts"].append(count)
+
+    return {"global_em": global_em, "global_f1": global_f1, "data": data}
+
+
+def compute_answer_scores_with_official_scripts(
+    original_prediction_instances: List[Dict],
+    dataset: str,
+    run_in_subprocess: bool = False,
+    score_cache: Dict[str, List] = None,
+) -> Dict:
+    # score_cache is only used for the datasets without an official evaluation script.
+
+    metrics = {}
+    if dataset in ("drop_dev", "tatqa_dev"):
 
-        with open(official_metrics_path) as file:
-            metrics = json.loads(file.read())
-            metrics["ans_em"] = round(metrics.pop("global_em") * 100, 1)
-            metrics["ans_f1"] = round(metrics.pop("global_f1") * 100, 1)
+        if run_in_subprocess:
+            metrics = run_official_evaluation_script_in_subprocess(
+                original_prediction_instances, dataset
+            )
+        else:
+            metrics = run_official_evaluation_in_process(
+                original_prediction_instances, dataset
+            )
+        metrics["ans_em"] = round(metrics.pop("global_em") * 100, 1)
+        metrics["ans_f1"] = round(metrics.pop("global_f1") * 100, 1)
 
     elif dataset in (
         "iirc_gold_dev",
@@ -187,13 +357,13 @@ def compute_answer_scores_with_official_scripts(
         "iirc_retrieved_test",
     ):
 
-        metrics = compute_answer_scores(original_prediction_instances)
+        metrics = compute_answer_scores(original_prediction_instances, score_cache)
         metrics["ans_em"] = metrics["ans_em"]
         metrics["ans_f1"] = metrics["ans_f1"]
 
     elif dataset in ("numglue_dev", "numglue_test"):
 
-        metrics_data = compute_answer_scores(original_prediction_instances)["data"]
+        metrics_data = compute_answer_scores(original_prediction_instances, score_cache)["data"]
         type_to_em = {}
         type_to_f1 = {}
         for num in range(1, 8 + 1):
@@ -211,7 +381,7 @@ def compute_answer_scores_with_official_scripts(
 
     elif dataset in ("drop_cs", "drop_bpb"):
 
-        metrics = compute_answer_scores(original_prediction_instances)
+        metrics = compute_answer_scores(original_prediction_instances, score_cache)
 
     elif dataset in ("tatqa_test", "drop_test"):
         raise Exception(
@@ -224,6 +394,67 @@ def compute_answer_scores_with_official_scripts(
     return metrics
 
 
+def evaluate_prediction_file(
+    prediction_path: str,
+    dataset: str,
+    output_file_path: str = None,
+    run_official_scripts_in_subprocess: bool = False,
+    evaluation_cache_directory: str = None,
+) -> Dict:
+    prediction_instances = list(iterate_dataset(prediction_path))
+    print(f"Number of prediction_instances: {len(prediction_instances)}")
+
+    score_cache = None
+    if evaluation_cache_directory and dataset not in DATASET_TO_OFFICIAL_GOLD_PATH:
+        # Keyed by the full path too, as prediction files of different variants (e.g.
+        # predictions/int8/) have the same name.
+        prediction_path_hash = hashlib.blake2b(
+            os.path.abspath(prediction_path).encode("utf-8"), digest_size=8
+        ).hexdigest()
+        score_cache_path = os.path.join(
+            evaluation_cache_directory,
+            dataset,
+            os.path.splitext(os.path.basename(prediction_path))[0]
+            + f".{prediction_path_hash}.json",
+        )
+        score_cache = {}
+        if os.path.exists(score_cache_path):
+            cached = read_json(score_cache_path)
+            if cached.get("metrics_version") == get_metrics_version():
+                score_cache = cached["scores"]
+            else:
+                print(f"Discarding {score_cache_path} as the metric code has changed.")
+
+    result = compute_answer_scores_with_official_scripts(
+        prediction_instances,
+        dataset,
+        run_in_subprocess=run_official_scripts_in_subprocess,
+        score_cache=score_cache,
+    )
+    result.pop("data", None)
+
+    if score_cache is not None:
+        write_json(
+            {"metrics_version": get_metrics_version(), "scores": score_cache},
+            score_cache_path + ".tmp",
+        )
+        os.replace(score_cache_path + ".tmp", score_cache_path)
+
+    print("\n---------------------------------------")
+
+    print("Answer Metrics:")
+    for key, value in result.items():
+        print(f"{key}: {value}")
+
+    if output_file_path:
+        print(f"Saving metrics in {output_file_path}")
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+        with open(output_file_path, "w") as file:
+            json.dump(result, file)
+
+    return result
+
+
 def main():
 
     parser = argparse.ArgumentParser(description="Evaluate predictions.")
@@ -249,26 +480,30 @@ def main():
         help="dataset for official eval.",
     )
     parser.add_argument("--output_file_path", type=str, help="file path to save metrics in.")
+    parser.add_argument(
+        "--run_official_scripts_in_subprocess",
+        action="store_true",
+        default=False,
+        help="run the official evaluation scripts (drop_dev, tatqa_dev) in a subprocess "
+        "as before, instead of in-process. Only useful to validate the latter.",
+    )
+    parser.add_argument(
+        "--evaluation_cache_directory",
+        type=str,
+        default=None,
+        help="directory to cache the per-instance scores in (e.g. .evaluation_cache). "
+        "If given, only new or changed instances are rescored on reruns. Not used for "
+        "drop_dev and tatqa_dev, which are always scored by their official scripts.",
+    )
     args = parser.parse_args()
 
-    prediction_instances = read_jsonl(args.prediction_path)
-    print(f"Number of prediction_instances: {len(prediction_instances)}")
-    result = compute_answer_scores_with_official_scripts(
-        prediction_instances, args.dataset
+    evaluate_prediction_file(
+        args.prediction_path,
+        args.dataset,
+        output_file_path=args.output_file_path,
+        run_official_scripts_in_subprocess=args.run_official_scripts_in_subprocess,
+        evaluation_cache_directory=args.evaluation_cache_directory,
     )
-    result.pop("data", None)
-
-    print("\n---------------------------------------")
-
-    print("Answer Metrics:")
-    for key, value in result.items():
-        print(f"{key}: {value}")
-
-    if args.output_file_path:
-        print(f"Saving metrics in {args.output_file_path}")
-        os.makedirs(os.path.dirname(args.output_file_path), exist_ok=True)
-        with open(args.output_file_path, "w") as file:
-            json.dump(result, file)
 
 
 if __name__ == "__main__":
@@ -1,53 +1,133 @@
+from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import glob
+import sys
 import os
-import subprocess
+import time
 
-from constants import ALL_MODEL_NAMES, EVALUATION_NAME_TO_FILEPATH
+from constants import EVALUATION_NAME_TO_FILEPATH
 
+# The metric code is imported once here. The pool's worker processes inherit it (and
+# the official gold annotations loaded below) on fork, and import it once otherwise.
+from evaluate import (
+    DATASET_TO_OFFICIAL_GOLD_PATH,
+    evaluate_prediction_file,
+    import_official_evaluation_script,
+    load_official_gold_annotations,
+)
 
-def main():
 
-    for index, model_name in enumerate(ALL_MODEL_NAMES):
-        print(f"\n\nWorking on model {index+1}/{len(ALL_MODEL_NAMES)} [{model_name}].")
+def get_evaluation_jobs(variant: str = None) -> List[Tuple[str, str, str]]:
+    # Evaluates the {model_with_data_name}__{evaluation_name}.jsonl files that exist in the
+    # predictions directory, rather than a fixed grid of models and datasets.
 
-        for evaluation_name in EVALUATION_NAME_TO_FILEPATH.keys():
+    predictions_directory = os.path.join("predictions", variant or "")
+    evaluations_directory = os.path.join("evaluations", variant or "")
 
-            if evaluation_name in ("drop_test", "tatqa_test"):
-                print(f"Skipping {evaluation_name} as it needs to be evaluated on the leaderboard.")
-                continue
+    evaluation_jobs = []
+    for prediction_file_path in sorted(
+        glob.glob(os.path.join(predictions_directory, "*__*.jsonl"))
+    ):
+        file_name = os.path.splitext(os.path.basename(prediction_file_path))[0]
+        evaluation_name = file_name.split("__")[-1]
 
-            model_with_data_name = model_name
-            model_with_data_name += "-"
-            model_with_data_name += (
-                evaluation_name.replace("_dev", "").replace("_test", "").replace(
-                    "_cs", ""
-                ).replace("_bpb", "").replace("_", "-")
+        if evaluation_name not in EVALUATION_NAME_TO_FILEPATH:
+            print(
+                f"Unknown evaluation name {evaluation_name} of {prediction_file_path}. "
+                f"So skipping it."
             )
+            continue
 
-            prediction_file_path = os.path.join(
-                "predictions", model_with_data_name + "__" + evaluation_name + ".jsonl"
-            )
-            output_file_path = os.path.join(
-                "evaluations", model_with_data_name + "__" + evaluation_name + ".json"
-            )
+        if evaluation_name in ("drop_test", "tatqa_test"):
+            continue
 
-            if not os.path.exists(prediction_file_path):
-                print(
-                    f"The prediction file path {prediction_file_path} doesn't exist yet. "
-                    f"So skipping evaluation for now."
-                )
-                continue
+        output_file_path = os.path.join(evaluations_directory, file_name + ".json")
+        evaluation_jobs.append((prediction_file_path, evaluation_name, output_file_path))
+
+    return evaluation_jobs
+
+
+def main():
 
-            command = " ".join(
-                [
-                    "python",
-                    "evaluate.py",
+    parser = argparse.ArgumentParser(description="Evaluate all predictions.")
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of processes to evaluate the prediction files with. "
+        "Use 1 to evaluate them one after another in this process.",
+    )
+    parser.add_argument(
+        "--evaluation_cache_directory",
+        type=str,
+        default=None,
+        help="directory to cache the per-instance scores in (e.g. .evaluation_cache). "
+        "If given, only new or changed instances are rescored on reruns. Not used for "
+        "drop_dev and tatqa_dev, which are always scored by their official scripts.",
+    )
+    parser.add_argument(
+        "--variant",
+        type=str,
+        default=None,
+        help="evaluate the predictions in predictions/<variant>/ (e.g. int8, see "
+        "predict_all.py) and save the evaluations in evaluations/<variant>/.",
+    )
+    args = parser.parse_args()
+
+    print("Skipping drop_test and tatqa_test as they need to be evaluated on the leaderboard.")
+    evaluation_jobs = get_evaluation_jobs(args.variant)
+    # Evaluating files of the same dataset together makes the gold annotations more
+    # likely to be reused within a worker.
+    evaluation_jobs = sorted(evaluation_jobs, key=lambda job: (job[1], job[0]))
+    print(f"Evaluating {len(evaluation_jobs)} prediction files.")
+
+    for evaluation_name in sorted(set(job[1] for job in evaluation_jobs)):
+        if evaluation_name in DATASET_TO_OFFICIAL_GOLD_PATH:
+            import_official_evaluation_script(evaluation_name.split("_")[0] + "_eval")
+            load_official_gold_annotations(DATASET_TO_OFFICIAL_GOLD_PATH[evaluation_name])
+
+    start_time = time.perf_counter()
+    failed_prediction_file_paths = []
+    if args.num_workers == 1:
+        for prediction_file_path, evaluation_name, output_file_path in evaluation_jobs:
+            try:
+                evaluate_prediction_file(
                     prediction_file_path,
                     evaluation_name,
-                    f"--output_file_path {output_file_path}"
-                ]
-            )
-            print(command)
-            subprocess.call(command.split())
+                    output_file_path=output_file_path,
+                    evaluation_cache_directory=args.evaluation_cache_directory,
+                )
+            except Exception as exception:
+                print(f"Evaluation of {prediction_file_path} failed: {exception!r}")
+                failed_prediction_file_paths.append(prediction_file_path)
+    else:
+        with ProcessPoolExecutor(max_workers=args.num_workers) as executor:
+            future_to_prediction_file_path = {
+                executor.submit(
+                    evaluate_prediction_file,
+                    prediction_file_path,
+                    evaluation_name,
+                    output_file_path=output_file_path,
+                    evaluation_cache_directory=args.evaluation_cache_directory,
+                ): prediction_file_path
+                for prediction_file_path, evaluation_name, output_file_path in evaluation_jobs
+            }
+            for future in as_completed(future_to_prediction_file_path):
+                prediction_file_path = future_to_prediction_file_path[future]
+                try:
+                    future.result()
+                except Exception as exception:
+                    print(f"Evaluation of {prediction_file_path} failed: {exception!r}")
+                    failed_prediction_file_paths.append(prediction_file_path)
+
+    seconds = time.perf_counter() - start_time
+    print(f"Evaluated {len(evaluation_jobs)} prediction files in {seconds:.1f}s.")
+    if failed_prediction_file_paths:
+        sys.exit(
+            f"Evaluation failed for {len(failed_prediction_file_paths)} prediction files: "
+            + ", ".join(sorted(failed_prediction_file_paths))
+        )
 
 
 if __name__ == "__main__":
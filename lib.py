@@ -1,10 +1,13 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Iterable, Sequence, Tuple
+from array import array
+import struct
+import pickle
 import json
+import mmap
 import os
 import io
 
 import base58
-import dill
 import hashlib
 
 
@@ -16,6 +19,14 @@ def read_jsonl(file_path: str) -> List[Dict]:
     return instances
 
 
+def iterate_jsonl(file_path: str) -> Iterator[Dict]:
+    # Lazy version of read_jsonl: only one line is held in memory at a time.
+    with open(file_path, "r") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line.strip())
+
+
 def write_jsonl(instances: List[Dict], file_path: str):
     print(f"Writing {len(instances)} instance in {file_path}")
     with open(file_path, "w") as file:
@@ -38,10 +49,193 @@ def read_json(file_path: str) -> Dict:
     return instance
 
 
+def get_chunk_bounds(num_items: int, chunk_index: int, num_chunks: int) -> Tuple[int, int]:
+    # Splits num_items into num_chunks contiguous chunks of (almost) the same size, so
+    # that concatenating the chunks in order gives back the original order.
+    if not 0 <= chunk_index < num_chunks:
+        raise ValueError(f"Invalid chunk_index {chunk_index} for {num_chunks} chunks.")
+    start = num_items * chunk_index // num_chunks
+    end = num_items * (chunk_index + 1) // num_chunks
+    return start, end
+
+
+# An indexed dataset is a single binary file that stores the instances of a jsonl dataset
+# such that the (long) context_text of the instances is stored once per distinct text,
+# and any instance can be read without parsing the rest. Its layout is:
+#   header: magic, number of contexts, number of instances, offset of the index
+#   body: utf-8 encoded contexts and json encoded instances (without their context_text)
+#   index: (start, end) of each context, (start, end) of each instance, and the context
+#          number of each instance (-1 if it doesn't have one)
+# All the numbers are native-endian 64 bit integers.
+INDEXED_DATASET_SUFFIX = ".indexed"
+INDEXED_DATASET_MAGIC = b"TBIDX001"
+INDEXED_DATASET_HEADER = struct.Struct("=8sqqq")
+INDEXED_DATASET_FIELD = "context_text"
+
+
+def write_indexed_dataset(instances: Iterable[Dict], file_path: str) -> None:
+    context_text_to_number = {}
+    context_spans = array("q")
+    instance_spans = array("q")
+    instance_context_numbers = array("q")
+    temporary_file_path = file_path + ".tmp"
+    with open(temporary_file_path, "wb") as file:
+        file.write(b"\0" * INDEXED_DATASET_HEADER.size)
+        for instance in instances:
+            context_text = instance.get(INDEXED_DATASET_FIELD)
+            if context_text is None:
+                instance_context_numbers.append(-1)
+            else:
+                if context_text not in context_text_to_number:
+                    context_text_to_number[context_text] = len(context_text_to_number)
+                    start = file.tell()
+                    file.write(context_text.encode("utf-8"))
+                    context_spans.extend((start, file.tell()))
+                instance_context_numbers.append(context_text_to_number[context_text])
+                instance = {**instance, INDEXED_DATASET_FIELD: None}  # Keeps the key order.
+            start = file.tell()
+            file.write(json.dumps(instance).encode("utf-8"))
+            instance_spans.extend((start, file.tell()))
+
+        index_offset = file.tell()
+        context_spans.tofile(file)
+        instance_spans.tofile(file)
+        instance_context_numbers.tofile(file)
+        file.seek(0)
+        file.write(
+            INDEXED_DATASET_HEADER.pack(
+                INDEXED_DATASET_MAGIC,
+                len(context_text_to_number),
+                len(instance_context_numbers),
+                index_offset,
+            )
+        )
+    os.replace(temporary_file_path, file_path)
+    print(
+        f"Wrote {len(instance_context_numbers)} instances with "
+        f"{len(context_text_to_number)} distinct contexts in {file_path}"
+    )
+
+
+class IndexedDataset(Sequence):
+    """
+    Random access, memory-mapped reader of a file written by write_indexed_dataset.
+    Instances are parsed only when accessed, and contexts are shared through the page cache.
+    Call close (or use it as a context manager) to release the file once done.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self._file = open(file_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, num_contexts, num_instances, index_offset = (
+            INDEXED_DATASET_HEADER.unpack_from(self._mmap)
+        )
+        if magic != INDEXED_DATASET_MAGIC:
+            raise Exception(f"The file {file_path} isn't an indexed dataset.")
+        self._index = memoryview(self._mmap)[index_offset:].cast("q")
+        self._context_spans = self._index[: 2 * num_contexts]
+        self._instance_spans = self._index[
+            2 * num_contexts : 2 * (num_contexts + num_instances)
+        ]
+        self._instance_context_numbers = self._index[2 * (num_contexts + num_instances) :]
+        self._num_instances = num_instances
+
+    def __len__(self) -> int:
+        return self._num_instances
+
+    def __getitem__(self, index: int) -> Dict:
+        if index < 0:
+            index += self._num_instances
+        if not 0 <= index < self._num_instances:
+            raise IndexError("IndexedDataset index out of range")
+        start, end = self._instance_spans[2 * index], self._instance_spans[2 * index + 1]
+        instance = json.loads(self._mmap[start:end])
+        context_number = self._instance_context_numbers[index]
+        if context_number >= 0:
+            start = self._context_spans[2 * context_number]
+            end = self._context_spans[2 * context_number + 1]
+            instance[INDEXED_DATASET_FIELD] = self._mmap[start:end].decode("utf-8")
+        return instance
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(self._num_instances):
+            yield self[index]
+
+    def close(self) -> None:
+        # The views of the index have to be released before the mmap can be closed.
+        for view in (
+            self._context_spans,
+            self._instance_spans,
+            self._instance_context_numbers,
+            self._index,
+        ):
+            view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> "IndexedDataset":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def read_dataset(file_path: str) -> Sequence[Dict]:
+    # Reads either an indexed dataset (lazily, so it has to be closed once done) or a
+    # jsonl one.
+    if file_path.endswith(INDEXED_DATASET_SUFFIX):
+        return IndexedDataset(file_path)
+    return read_jsonl(file_path)
+
+
+def iterate_indexed_dataset(file_path: str) -> Iterator[Dict]:
+    # Closes it once the iteration is done (or the iterator is closed).
+    with IndexedDataset(file_path) as dataset:
+        yield from dataset
+
+
+def iterate_dataset(file_path: str) -> Iterator[Dict]:
+    if file_path.endswith(INDEXED_DATASET_SUFFIX):
+        return iterate_indexed_dataset(file_path)
+    return iterate_jsonl(file_path)
+
+
+def hash_file(file_path: str) -> str:
+    """Returns a character hash code of the content of a file."""
+    m = hashlib.blake2b()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            m.update(chunk)
+    return base58.b58encode(m.digest()).decode()
+
+
+# Pickle protocol of the fast path of hash_object. It's dill's default protocol on python
+# 3.8 to 3.13, on which both give the same bytes (and so hashes) for primitive objects.
+PRIMITIVE_PICKLE_PROTOCOL = 4
+PRIMITIVE_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def is_primitive(o: Any) -> bool:
+    """Whether o is a str/bytes/number/bool/None or a tuple/list of (only) those."""
+    # Not isinstance, as subclasses (e.g., numpy.str_) may pickle differently.
+    if type(o) in PRIMITIVE_TYPES:
+        return True
+    if type(o) in (tuple, list):
+        return all(is_primitive(e) for e in o)
+    return False
+
+
 def hash_object(o: Any) -> str:
     # Taken from allennlp
     """Returns a character hash code of arbitrary Python objects."""
     m = hashlib.blake2b()
+    if is_primitive(o):
+        # Plain pickle is much faster than dill (and doesn't need importing it), and
+        # with a fixed protocol, the hash doesn't change across python versions.
+        m.update(pickle.dumps(o, protocol=PRIMITIVE_PICKLE_PROTOCOL))
+        return base58.b58encode(m.digest()).decode()
+    import dill
+
     with io.BytesIO() as buffer:
         dill.dump(o, buffer)
         m.update(buffer.getbuffer())
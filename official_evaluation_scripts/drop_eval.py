@@ -1,6 +1,7 @@
 #!/usr/bin/python
 
 from collections import defaultdict
+from functools import lru_cache
 from typing import Any, Dict, List, Set, Tuple, Union, Optional
 import json
 import argparse
@@ -41,6 +42,13 @@ def _tokenize(text: str) -> List[str]:
     return re.split(" |-", text)
 
 
+# The same (mostly gold) strings get normalized over and over again while scoring, so
+# normalization is memoized by the raw string. Bounded so that it can't grow unboundedly
+# in long-running processes.
+NORMALIZATION_CACHE_SIZE = 2**18
+
+
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
 def _normalize_answer(text: str) -> str:
     """Lower text and remove punctuation, articles and extra whitespace."""
 
@@ -55,6 +63,7 @@ def _normalize_answer(text: str) -> str:
     return normalized
 
 
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
 def _is_number(text: str) -> bool:
     try:
         float(text)
@@ -194,6 +203,19 @@ def answer_json_to_strings(answer: Dict[str, Any]) -> Tuple[Tuple[str, ...], str
 def evaluate_json(
     annotations: Dict[str, Any], predicted_answers: Dict[str, Any]
 ) -> Tuple[float, float]:
+    """
+    Same as :func:`evaluate_json_with_type_scores`, but only returns the global
+    exact match and F1.
+    """
+    global_em, global_f1, _, _ = evaluate_json_with_type_scores(
+        annotations, predicted_answers
+    )
+    return global_em, global_f1
+
+
+def evaluate_json_with_type_scores(
+    annotations: Dict[str, Any], predicted_answers: Dict[str, Any]
+) -> Tuple[float, float, Dict[str, List[float]], Dict[str, List[float]]]:
     """
     Takes gold annotations and predicted answers and  evaluates the predictions for each question
     in the gold annotations.  Both JSON dictionaries must have query_id keys, which are used to
@@ -202,7 +224,8 @@ def evaluate_json(
 
     The ``annotations`` are assumed to have the format of the dev set in the DROP data release.
     The ``predicted_answers`` JSON must be a dictionary keyed by query id, where the value is a string
-    (or list of strings) that is the answer.
+    (or list of strings) that is the answer. Along with the global exact match and F1, returns
+    the exact match and F1 of each instance grouped by answer type.
     """
     instance_exact_match = []
     instance_f1 = []
@@ -256,7 +279,7 @@ def evaluate_json(
         )
         print("  Exact-match accuracy {0:.3f}".format(100.0 * np.mean(type_to_em[typ])))
         print("  F1 score {0:.3f}".format(100.0 * np.mean(type_to_f1[typ])))
-    return global_em, global_f1
+    return global_em, global_f1, type_to_em, type_to_f1
 
 
 def evaluate_prediction_file(
@@ -8,6 +8,17 @@ from typing import Any, Dict, Tuple
 def evaluate_json(
     golden_answers: Dict[str, Any], predicted_answers: Dict[str, Any]
 ) -> Tuple[float, float]:
+    global_em, global_f1, _, _, _ = evaluate_json_with_detail_scores(
+        golden_answers, predicted_answers
+    )
+    return global_em, global_f1
+
+
+def evaluate_json_with_detail_scores(
+    golden_answers: Dict[str, Any], predicted_answers: Dict[str, Any]
+) -> Tuple[float, float, Any, Any, Any]:
+    # Along with the global em and f1, returns the em, f1 and count pivot tables
+    # (answer_type x answer_from).
 
     em_and_f1 = TaTQAEmAndF1()
     for qas in golden_answers:
@@ -35,7 +46,7 @@ def evaluate_json(
     print("---- f1 detail ---")
     print(detail_f1)
 
-    return global_em, global_f1
+    return global_em, global_f1, detail_em, detail_f1, detail_raw
 
 
 def evaluate_prediction_file(gold_path: str, pred_path: str, output_path: str):
@@ -1,14 +1,28 @@
 import os
 import json
+import time
 import argparse
-from typing import List, Dict
+import multiprocessing.pool
+from typing import List, Dict, Iterator, Optional, Tuple
+from collections import Counter, defaultdict
+import itertools
+import functools
+import inspect
+import shutil
 
 from tqdm import tqdm
+import numpy as np
 import torch
+import torch.multiprocessing
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 
-from lib import read_jsonl
-from constants import ANS_DELIMITER
+from lib import iterate_dataset, read_json, hash_file, hash_object
+from constants import (
+    ANS_DELIMITER,
+    PARTIAL_PREDICTIONS_SUFFIX,
+    PREDICTION_TIMING_SUFFIX,
+    QUANTIZE_OPTIONS,
+)
 from digit_tokenization import enable_digit_tokenization
 
 
@@ -42,6 +56,24 @@ def prepare_input_text_in_unifiedqa_format(
     return input_text
 
 
+def infer_format_type(tokenizer: AutoTokenizer) -> str:
+    if "nt5" in tokenizer.name_or_path.lower():
+        format_type = "nt5"
+    elif "preasm" in tokenizer.name_or_path.lower():
+        format_type = "unifiedqa"
+    elif "poet" in tokenizer.name_or_path.lower():
+        format_type = "nt5"
+    elif "t5" in tokenizer.name_or_path.lower():
+        format_type = "nt5"
+    elif "bart" in tokenizer.name_or_path.lower():
+        format_type = "nt5"
+    else:
+        raise Exception(
+            "The input format_type couldn't be inferred. Please pass it explicitly."
+        )
+    return format_type
+
+
 def prepare_input_text(
     tokenizer: AutoTokenizer,
     question_text: str,
@@ -55,20 +87,7 @@ def prepare_input_text(
         assert format_type in ("nt5", "unifiedqa")
     else:
         # Or we'll try to infer it automatically.
-        if "nt5" in tokenizer.name_or_path.lower():
-            format_type = "nt5"
-        elif "preasm" in tokenizer.name_or_path.lower():
-            format_type = "unifiedqa"
-        elif "poet" in tokenizer.name_or_path.lower():
-            format_type = "nt5"
-        elif "t5" in tokenizer.name_or_path.lower():
-            format_type = "nt5"
-        elif "bart" in tokenizer.name_or_path.lower():
-            format_type = "nt5"
-        else:
-            raise Exception(
-                "The input format_type couldn't be inferred. Please pass it explicitly."
-            )
+        format_type = infer_format_type(tokenizer)
 
     if format_type == "nt5":
         function = prepare_input_text_in_nt5_format
@@ -80,15 +99,53 @@ def prepare_input_text(
     )
 
 
-def _generate_predictions(
+def load_tokenizer(
+    hf_model_name_or_path: str, use_fast: bool = False
+) -> AutoTokenizer:
+    tokenizer = AutoTokenizer.from_pretrained(hf_model_name_or_path, use_fast=use_fast)
+    enable_digit_tokenization(tokenizer)
+    return tokenizer
+
+
+def is_bf16_supported_by_cpu() -> Optional[bool]:
+    # torch 1.12 has no api for it, so we check the cpu flags instead. Returns None
+    # if they're unknown (not on linux).
+    if not os.path.exists("/proc/cpuinfo"):
+        return None
+    with open("/proc/cpuinfo") as file:
+        return any(
+            line.startswith("flags") and "avx512_bf16" in line.split()
+            for line in file
+        )
+
+
+def quantize_model(
+    model: AutoModelForSeq2SeqLM, quantize: str = None
+) -> AutoModelForSeq2SeqLM:
+    if quantize is None:
+        return model
+    if quantize == "int8":
+        # Dynamic quantization: the weights of the linear layers are stored in int8,
+        # and activations are quantized on the fly. Only supported for cpu.
+        return torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    if quantize == "bf16":
+        if is_bf16_supported_by_cpu() is False:
+            print(
+                "Warning: This cpu doesn't support bf16 natively, "
+                "so bf16 inference is likely slower than fp32 here."
+            )
+        return model.to(torch.bfloat16)
+    raise Exception(f"Unknown quantize option: {quantize}")
+
+
+def prepare_input_ids(
     tokenizer: AutoTokenizer,
-    model: AutoModelForSeq2SeqLM,
     instances: List[Dict],
-    device: torch.device("cpu"),
     max_context_length: int = 600,
     max_question_length: int = 100,
-) -> List[Dict]:
-
+) -> List[List[int]]:
     prepared_input_texts = [
         prepare_input_text(
             tokenizer,
@@ -99,20 +156,252 @@ def _generate_predictions(
         )
         for instance in instances
     ]
-    if model.device != device:
-        model.to(device)
     input_ids = tokenizer(
         prepared_input_texts,
-        return_tensors="pt",
         truncation=True,
         max_length=800,
         add_special_tokens=True,
+    )["input_ids"]
+    return input_ids
+
+
+class TokenizationCache:
+    """
+    Token ids of the prepared inputs of all the instances of an evaluation file,
+    stored flat on disk (input_ids.bin) along with the offsets of each instance
+    (offsets.npy), and memory-mapped on load.
+    """
+
+    def __init__(self, cache_path: str) -> None:
+        self._offsets = np.load(os.path.join(cache_path, "offsets.npy"))
+        if self._offsets[-1]:
+            self._input_ids = np.memmap(
+                os.path.join(cache_path, "input_ids.bin"), dtype=np.int32, mode="r"
+            )
+        else:  # Empty files can't be memory-mapped.
+            self._input_ids = np.zeros(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> List[int]:
+        return self._input_ids[self._offsets[index] : self._offsets[index + 1]].tolist()
+
+
+def get_tokenizer_fingerprint(tokenizer: AutoTokenizer) -> str:
+    # Tokenizers of the same class with the same vocabulary and special tokens
+    # (e.g., of t5-large and teabreac-t5-3b) give the same token ids. It's the same
+    # for the slow and fast tokenizers (see tests/test_digit_tokenization.py).
+    return hash_object(
+        (
+            tokenizer.__class__.__name__.replace("Fast", ""),
+            sorted(tokenizer.get_vocab().items()),
+            tokenizer.all_special_tokens,
+        )
+    )
+
+
+def get_input_ids_code_hash() -> str:
+    # The token ids of the instances also depend on the code of the digit tokenization
+    # patch and of the input formatting.
+    input_formatting_functions = [
+        prepare_input_text_in_nt5_format,
+        prepare_input_text_in_unifiedqa_format,
+        infer_format_type,
+        prepare_input_text,
+        prepare_input_ids,
+    ]
+    return hash_object(
+        (
+            hash_file(inspect.getsourcefile(enable_digit_tokenization)),
+            [inspect.getsource(function) for function in input_formatting_functions],
+        )
+    )
+
+
+DEFAULT_MAX_GENERATION_LENGTH = 50
+# See compute_generation_profiles.py
+GENERATION_PROFILES_PATH = "generation_profiles.json"
+
+
+def get_max_generation_length(
+    tokenizer: AutoTokenizer,
+    evaluation_path: str,
+    generation_profiles_path: str = GENERATION_PROFILES_PATH,
+) -> int:
+    # The dataset is identified by its directory in processed_target_datasets.
+    dataset_name = os.path.basename(os.path.dirname(os.path.abspath(evaluation_path)))
+    if generation_profiles_path and os.path.exists(generation_profiles_path):
+        generation_profiles = read_json(generation_profiles_path)
+        tokenizer_profiles = generation_profiles.get(
+            get_tokenizer_fingerprint(tokenizer), {}
+        )
+        if dataset_name in tokenizer_profiles:
+            max_length = tokenizer_profiles[dataset_name]["max_length"]
+            print(
+                f"Using the generation profile of {dataset_name}: "
+                f"max_length={max_length}."
+            )
+            return max_length
+    print(
+        f"No generation profile found for {dataset_name} with this tokenizer. "
+        f"Using max_length={DEFAULT_MAX_GENERATION_LENGTH}."
+    )
+    return DEFAULT_MAX_GENERATION_LENGTH
+
+
+def load_tokenization_cache(
+    tokenizer: AutoTokenizer,
+    evaluation_path: str,
+    cache_directory: str,
+    max_context_length: int = 600,
+    max_question_length: int = 100,
+    chunk_size: int = 1000,
+) -> TokenizationCache:
+    cache_key = hash_object(
+        (
+            get_tokenizer_fingerprint(tokenizer),
+            tokenizer.is_fast,
+            get_input_ids_code_hash(),
+            infer_format_type(tokenizer),
+            max_context_length,
+            max_question_length,
+            hash_file(evaluation_path),
+        )
+    )
+    cache_path = os.path.join(cache_directory, cache_key)
+    if os.path.exists(cache_path):
+        print(f"Loading tokenization cache from {cache_path}.")
+        return TokenizationCache(cache_path)
+
+    # Build it in a temporary directory and move it in place once done, so that
+    # an interrupted or concurrent build never leaves a broken cache behind.
+    print(f"Building tokenization cache in {cache_path}.")
+    temporary_cache_path = f"{cache_path}.{os.getpid()}.tmp"
+    os.makedirs(temporary_cache_path, exist_ok=True)
+    offsets = [0]
+    instances_iterator = iterate_dataset(evaluation_path)
+    chunks = iter(lambda: list(itertools.islice(instances_iterator, chunk_size)), [])
+    with open(os.path.join(temporary_cache_path, "input_ids.bin"), "wb") as file:
+        for instances in tqdm(chunks, unit="chunk"):
+            for input_ids in prepare_input_ids(
+                tokenizer,
+                instances,
+                max_context_length=max_context_length,
+                max_question_length=max_question_length,
+            ):
+                np.asarray(input_ids, dtype=np.int32).tofile(file)
+                offsets.append(offsets[-1] + len(input_ids))
+    np.save(
+        os.path.join(temporary_cache_path, "offsets.npy"),
+        np.asarray(offsets, dtype=np.int64),
+    )
+    try:
+        os.replace(temporary_cache_path, cache_path)
+    except OSError:  # Another run built it in the meantime.
+        shutil.rmtree(temporary_cache_path)
+    return TokenizationCache(cache_path)
+
+
+def make_batches(
+    input_ids: List[List[int]],
+    batch_size: int = 8,
+    max_tokens_per_batch: int = None,
+    group_keys: List[str] = None,
+) -> List[List[int]]:
+    # Returns batches of indices into input_ids. If group_keys (e.g. passage ids) are
+    # given, instances of the same group are kept next to each other in the batches.
+    group_to_first_index = {}
+    group_to_max_length = Counter()
+    if group_keys is not None:
+        for index, group_key in enumerate(group_keys):
+            group_to_first_index.setdefault(group_key, index)
+            group_to_max_length[group_key] = max(
+                group_to_max_length[group_key], len(input_ids[index])
+            )
+
+    if max_tokens_per_batch is None:
+        # Fixed number of instances per batch, in the original order.
+        if group_keys is None:
+            return [
+                list(range(index, min(index + batch_size, len(input_ids))))
+                for index in range(0, len(input_ids), batch_size)
+            ]
+        sorted_indices = sorted(
+            range(len(input_ids)),
+            key=lambda index: (group_to_first_index[group_keys[index]], index),
+        )
+        return [
+            sorted_indices[index : index + batch_size]
+            for index in range(0, len(sorted_indices), batch_size)
+        ]
+
+    # Length-bucketed batches: sort by length so that each batch is padded to
+    # a length close to that of all its members, and fill it up till the number
+    # of (padded) tokens in it reaches max_tokens_per_batch, or the number of
+    # instances in it reaches batch_size (so short inputs don't make batches of
+    # hundreds of instances, with as many decoder states). Longest first, so
+    # that if the budget is too large for the machine, it fails right away.
+    # With group_keys, the groups are sorted by their longest instance instead.
+    if group_keys is None:
+        sort_key = lambda index: -len(input_ids[index])
+    else:
+        sort_key = lambda index: (
+            -group_to_max_length[group_keys[index]],
+            group_to_first_index[group_keys[index]],
+            -len(input_ids[index]),
+        )
+    sorted_indices = sorted(range(len(input_ids)), key=sort_key)
+    batches = []
+    batch = []
+    padded_length = 0
+    for index in sorted_indices:
+        length = max(padded_length, len(input_ids[index]))
+        if batch and (
+            len(batch) >= batch_size or (len(batch) + 1) * length > max_tokens_per_batch
+        ):
+            batches.append(batch)
+            batch = []
+            length = len(input_ids[index])
+        batch.append(index)
+        padded_length = length
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def report_padding_efficiency(padding_stats: Dict) -> None:
+    if not padding_stats["num_padded_tokens"]:
+        return
+    padding_efficiency = (
+        padding_stats["num_tokens"] / padding_stats["num_padded_tokens"]
+    )
+    print(
+        f"Padding efficiency: {round(100 * padding_efficiency, 1)}% "
+        f"({padding_stats['num_tokens']} input tokens in "
+        f"{padding_stats['num_padded_tokens']} padded tokens)."
+    )
+
+
+def _generate_predictions(
+    tokenizer: AutoTokenizer,
+    model: AutoModelForSeq2SeqLM,
+    batch_input_ids: List[List[int]],
+    device: torch.device("cpu"),
+    max_length: int = DEFAULT_MAX_GENERATION_LENGTH,
+) -> List[str]:
+
+    if model.device != device:
+        model.to(device)
+    input_ids = tokenizer.pad(
+        {"input_ids": batch_input_ids},
+        return_tensors="pt",
         padding=True,
     )["input_ids"].to(device)
     generated_ids = model.generate(
         input_ids,
         min_length=1,
-        max_length=50,
+        max_length=max_length,
         num_beams=1,
     )
     generated_predictions = tokenizer.batch_decode(
@@ -131,63 +420,175 @@ def generate_predictions(
     instances: List[Dict],
     device: torch.device("cpu"),
     batch_size: int = 8,
+    max_tokens_per_batch: int = None,
     max_context_length: int = 600,
     max_question_length: int = 100,
-) -> List[Dict]:
+    padding_stats: Dict = None,
+    show_progress: bool = True,
+    pool: multiprocessing.pool.Pool = None,
+    worker_stats: Dict = None,
+    input_ids: List[List[int]] = None,
+    group_by_passage: bool = False,
+    max_generation_length: int = DEFAULT_MAX_GENERATION_LENGTH,
+) -> List[str]:
+
+    if not instances:
+        return []
 
     model.to(device)
 
-    predictions = []
-    for index in tqdm(range(0, len(instances), batch_size)):
-        batch_of_instances = instances[index : index + batch_size]
-        batch_of_predictions = _generate_predictions(
+    if input_ids is None:
+        input_ids = prepare_input_ids(
             tokenizer,
-            model,
-            batch_of_instances,
-            device=device,
+            instances,
             max_context_length=max_context_length,
             max_question_length=max_question_length,
         )
-        predictions += batch_of_predictions
+    batches = make_batches(
+        input_ids,
+        batch_size=batch_size,
+        max_tokens_per_batch=max_tokens_per_batch,
+        group_keys=(
+            [instance.get("passage_id") for instance in instances]
+            if group_by_passage
+            else None
+        ),
+    )
+
+    batches_of_input_ids = (
+        [input_ids[index] for index in batch] for batch in batches
+    )
+    if pool is None:
+        batches_of_predictions = (
+            _generate_predictions(
+                tokenizer,
+                model,
+                batch_input_ids,
+                device=device,
+                max_length=max_generation_length,
+            )
+            for batch_input_ids in batches_of_input_ids
+        )
+    else:
+        # imap hands out batches to the workers as they become free, but yields
+        # the results back in the order of the batches.
+        batches_of_predictions = _collect_worker_stats(
+            pool.imap(
+                functools.partial(
+                    _generate_predictions_in_worker, max_length=max_generation_length
+                ),
+                batches_of_input_ids,
+            ),
+            worker_stats,
+        )
+
+    # Batches may be formed out of order, so place predictions back by index.
+    predictions = [None] * len(instances)
+    for batch, batch_of_predictions in tqdm(
+        zip(batches, batches_of_predictions),
+        total=len(batches),
+        disable=not show_progress,
+    ):
+        if padding_stats is not None:
+            batch_lengths = [len(input_ids[index]) for index in batch]
+            padding_stats["num_tokens"] += sum(batch_lengths)
+            padding_stats["num_padded_tokens"] += len(batch) * max(batch_lengths)
+        for index, prediction in zip(batch, batch_of_predictions):
+            predictions[index] = prediction
 
     return predictions
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Generate predictions with one of the HF models on one of the datasets."
-    )
-    parser.add_argument("hf_model_name_or_path", type=str, help="hf_model_name_or_path")
-    parser.add_argument("evaluation_path", type=str, help="evaluation_path")
-    parser.add_argument("output_path", type=str, help="output_path")
-    parser.add_argument("--batch_size", type=int, help="batch_size", default=32)
-    parser.add_argument(
-        "--max_context_length", type=int, help="max_context_length", default=600
-    )
-    parser.add_argument(
-        "--max_question_length", type=int, help="max_question_length", default=100
+_worker_state = {}
+
+
+def _initialize_worker(
+    hf_model_name_or_path: str,
+    use_fast_tokenizer: bool,
+    model: AutoModelForSeq2SeqLM,
+    num_threads: int,
+    quantize: str = None,
+) -> None:
+    # Runs once in each worker process. The model comes in with its weights in
+    # shared memory, so all the workers read the same copy of them. If it's to be
+    # quantized to int8, each worker quantizes it on its own.
+    torch.set_num_threads(num_threads)
+    _worker_state["tokenizer"] = load_tokenizer(
+        hf_model_name_or_path, use_fast=use_fast_tokenizer
     )
-    args = parser.parse_args()
+    _worker_state["model"] = quantize_model(model, quantize)
+
 
-    tokenizer = AutoTokenizer.from_pretrained(
-        args.hf_model_name_or_path, use_fast=False
+def _generate_predictions_in_worker(
+    batch_input_ids: List[List[int]], max_length: int = DEFAULT_MAX_GENERATION_LENGTH
+) -> Dict:
+    start_time = time.time()
+    batch_of_predictions = _generate_predictions(
+        _worker_state["tokenizer"],
+        _worker_state["model"],
+        batch_input_ids,
+        device=torch.device("cpu"),
+        max_length=max_length,
     )
-    enable_digit_tokenization(tokenizer)
+    return {
+        "predictions": batch_of_predictions,
+        "worker_id": os.getpid(),
+        "seconds": time.time() - start_time,
+    }
 
-    model = AutoModelForSeq2SeqLM.from_pretrained(args.hf_model_name_or_path)
 
-    instances = read_jsonl(args.evaluation_path)
-    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
-    generated_predictions = generate_predictions(
-        tokenizer,
-        model,
-        instances,
-        device=device,
-        batch_size=args.batch_size,
-        max_context_length=args.max_context_length,
-        max_question_length=args.max_question_length,
+def _collect_worker_stats(
+    results: Iterator[Dict], worker_stats: Dict = None
+) -> Iterator[List[str]]:
+    for result in results:
+        if worker_stats is not None:
+            worker_stats[result["worker_id"]]["num_instances"] += len(
+                result["predictions"]
+            )
+            worker_stats[result["worker_id"]]["seconds"] += result["seconds"]
+        yield result["predictions"]
+
+
+def make_worker_pool(
+    hf_model_name_or_path: str,
+    use_fast_tokenizer: bool,
+    model: AutoModelForSeq2SeqLM,
+    num_workers: int,
+    num_threads_per_worker: int = None,
+    quantize: str = None,
+) -> multiprocessing.pool.Pool:
+    if num_threads_per_worker is None:
+        num_threads_per_worker = max(1, os.cpu_count() // num_workers)
+    # Moving the weights to shared memory lets them be passed to the (spawned)
+    # workers without a copy per worker.
+    model.share_memory()
+    pool = torch.multiprocessing.get_context("spawn").Pool(
+        num_workers,
+        initializer=_initialize_worker,
+        initargs=(
+            hf_model_name_or_path,
+            use_fast_tokenizer,
+            model,
+            num_threads_per_worker,
+            quantize,
+        ),
     )
+    return pool
+
+
+def report_worker_throughput(worker_stats: Dict) -> None:
+    for index, (worker_id, stats) in enumerate(sorted(worker_stats.items())):
+        print(
+            f"Worker {index} (pid {worker_id}): {stats['num_instances']} instances "
+            f"in {round(stats['seconds'], 1)}s "
+            f"({round(stats['num_instances'] / max(stats['seconds'], 1e-6), 2)} "
+            "instances/s)."
+        )
+
 
+def add_predicted_answers(
+    instances: List[Dict], generated_predictions: List[str]
+) -> None:
     for instance, generated_prediction in zip(instances, generated_predictions):
         generated_prediction = generated_prediction.strip()
         instance["predicted_text"] = generated_prediction
@@ -196,12 +597,338 @@ def main():
             for predicted_answer in generated_prediction.split(ANS_DELIMITER)
         ]
 
-    output_directory = os.path.dirname(args.output_path)
+
+def read_completed_question_ids(partial_output_path: str) -> Counter:
+    # Returns counts (question_ids needn't be unique) of the question_ids already
+    # predicted in partial_output_path, and truncates the last line if it was
+    # only partially written.
+    completed_question_ids = Counter()
+    if not os.path.exists(partial_output_path):
+        return completed_question_ids
+    valid_size = 0
+    with open(partial_output_path, "rb") as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            completed_question_ids[json.loads(line)["question_id"]] += 1
+            valid_size += len(line)
+    with open(partial_output_path, "r+b") as file:
+        file.truncate(valid_size)
+    return completed_question_ids
+
+
+def skip_completed_instances(
+    instances: Iterator[Dict], completed_question_ids: Counter
+) -> Iterator[Tuple[int, Dict]]:
+    # Yields the instances yet to be predicted along with their index in the file.
+    completed_question_ids = completed_question_ids.copy()
+    for index, instance in enumerate(instances):
+        if completed_question_ids[instance["question_id"]] > 0:
+            completed_question_ids[instance["question_id"]] -= 1
+            continue
+        yield index, instance
+
+
+DEFAULT_STREAM_CHUNK_SIZE = 1000
+
+
+def add_prediction_arguments(parser: argparse.ArgumentParser) -> None:
+    # All the options of predict.py except for the model and the files, so that they
+    # can be shared with predict_all.py.
+    parser.add_argument("--batch_size", type=int, help="batch_size", default=32)
+    parser.add_argument(
+        "--max_tokens_per_batch",
+        type=int,
+        help="if passed, batches are bucketed by input length and filled up to "
+        "these many (padded) tokens, with at most batch_size instances each.",
+        default=None,
+    )
+    parser.add_argument(
+        "--group_by_passage",
+        action="store_true",
+        help="batch questions on the same passage_id together. Useful when the "
+        "instances aren't already ordered by passage.",
+        default=False,
+    )
+    parser.add_argument(
+        "--max_generation_length",
+        type=int,
+        help="max length of the generated sequences. If not passed, it's "
+        f"{DEFAULT_MAX_GENERATION_LENGTH}, or that of the generation profile of the "
+        "dataset with --use_generation_profiles.",
+        default=None,
+    )
+    parser.add_argument(
+        "--use_generation_profiles",
+        action="store_true",
+        help="take the max generation length from the generation profile of the "
+        "dataset (see compute_generation_profiles.py) if there's one. Answers longer "
+        "than the profile's length are truncated, so EM/F1 can differ from those with "
+        "the default length.",
+        default=False,
+    )
+    parser.add_argument(
+        "--generation_profiles_path",
+        type=str,
+        help="generation_profiles_path",
+        default=GENERATION_PROFILES_PATH,
+    )
+    parser.add_argument(
+        "--quantize",
+        type=str,
+        choices=QUANTIZE_OPTIONS,
+        help="int8: dynamic int8 quantization of the linear layers (cpu only). "
+        "bf16: cast the model to bfloat16 (fast only on cpus with native bf16 "
+        "support).",
+        default=None,
+    )
+    parser.add_argument(
+        "--stream_chunk_size",
+        type=int,
+        help="instances are read lazily these many at a time and their predictions "
+        "are appended to the partial output file as each chunk finishes, so that an "
+        "interrupted run can be resumed. Use 0 to predict the whole file at once, "
+        "which buckets batches by length (see --max_tokens_per_batch) across the "
+        "whole file, but saves nothing until all the predictions are done.",
+        default=DEFAULT_STREAM_CHUNK_SIZE,
+    )
+    parser.add_argument(
+        "--use_fast_tokenizer",
+        action="store_true",
+        help="use the (rust-based) fast tokenizer. It gives the same token ids and "
+        "decoded text as the slow one (see tests/test_digit_tokenization.py), which you "
+        "can check on a model with benchmark_scripts/digit_tokenization_parity.py.",
+        default=False,
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        help="number of worker processes to shard the batches across (cpu only). "
+        "The model weights are shared between them.",
+        default=1,
+    )
+    parser.add_argument(
+        "--num_threads_per_worker",
+        type=int,
+        help="number of intra-op threads per worker. "
+        "Defaults to cpu_count / num_workers.",
+        default=None,
+    )
+    parser.add_argument(
+        "--tokenization_cache_directory",
+        type=str,
+        help="if passed, token ids of the inputs are cached in (and loaded from) this "
+        "directory, keyed by the tokenizer, the input formatting and the evaluation "
+        "file.",
+        default=None,
+    )
+    parser.add_argument(
+        "--max_context_length", type=int, help="max_context_length", default=600
+    )
+    parser.add_argument(
+        "--max_question_length", type=int, help="max_question_length", default=100
+    )
+    parser.add_argument(
+        "--low_cpu_mem_usage",
+        action="store_true",
+        help="load the weights directly into the model instead of first initializing "
+        "it randomly, which makes loading faster and halves its peak memory.",
+        default=False,
+    )
+
+
+def load_model(
+    hf_model_name_or_path: str, low_cpu_mem_usage: bool = False
+) -> AutoModelForSeq2SeqLM:
+    start_time = time.time()
+    model = AutoModelForSeq2SeqLM.from_pretrained(
+        hf_model_name_or_path, low_cpu_mem_usage=low_cpu_mem_usage
+    )
+    print(f"Loaded {hf_model_name_or_path} in {round(time.time() - start_time, 1)}s.")
+    return model
+
+
+def load_tokenizer_and_model(
+    args: argparse.Namespace,
+) -> Tuple[AutoTokenizer, AutoModelForSeq2SeqLM, torch.device]:
+
+    tokenizer = load_tokenizer(
+        args.hf_model_name_or_path, use_fast=args.use_fast_tokenizer
+    )
+
+    model = load_model(
+        args.hf_model_name_or_path, low_cpu_mem_usage=args.low_cpu_mem_usage
+    )
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    if args.quantize == "int8" and device.type != "cpu":
+        raise Exception("int8 quantization is only supported for cpu inference.")
+    if args.quantize == "bf16" or args.num_workers == 1:
+        # int8 models are quantized in each worker as quantized weights can't be shared.
+        model = quantize_model(model, args.quantize)
+
+    return tokenizer, model, device
+
+
+def predict_file(
+    tokenizer: AutoTokenizer,
+    model: AutoModelForSeq2SeqLM,
+    device: torch.device,
+    evaluation_path: str,
+    output_path: str,
+    args: argparse.Namespace,
+) -> None:
+    # args are the ones of add_prediction_arguments, along with hf_model_name_or_path.
+    output_directory = os.path.dirname(output_path)
     os.makedirs(output_directory, exist_ok=True)
-    print(f"Saving {len(instances)} predictions in {args.output_path}.")
-    with open(args.output_path, "w") as file:
-        for instance in instances:
-            file.write(json.dumps(instance) + "\n")
+
+    # Predictions are appended to a partial file, which is renamed to output_path
+    # only once all of them are done. If the partial file already exists, it's from
+    # an interrupted run, so we resume from where it left off.
+    partial_output_path = output_path + PARTIAL_PREDICTIONS_SUFFIX
+    completed_question_ids = read_completed_question_ids(partial_output_path)
+    if completed_question_ids:
+        print(
+            f"Resuming from {sum(completed_question_ids.values())} predictions "
+            f"already in {partial_output_path}."
+        )
+
+    if not args.stream_chunk_size:
+        chunks = [
+            list(
+                skip_completed_instances(
+                    iterate_dataset(evaluation_path), completed_question_ids
+                )
+            )
+        ]
+    else:
+        # Read, predict and write stream_chunk_size instances at a time, so that
+        # the memory stays flat and the output file is usable even if the run dies.
+        indexed_instances_iterator = skip_completed_instances(
+            iterate_dataset(evaluation_path), completed_question_ids
+        )
+        chunks = iter(
+            lambda: list(
+                itertools.islice(indexed_instances_iterator, args.stream_chunk_size)
+            ),
+            [],
+        )
+        chunks = tqdm(chunks, unit="chunk")
+
+    max_generation_length = args.max_generation_length
+    if max_generation_length is None and args.use_generation_profiles:
+        max_generation_length = get_max_generation_length(
+            tokenizer, evaluation_path, args.generation_profiles_path
+        )
+    elif max_generation_length is None:
+        max_generation_length = DEFAULT_MAX_GENERATION_LENGTH
+
+    tokenization_cache = None
+    if args.tokenization_cache_directory is not None:
+        tokenization_cache = load_tokenization_cache(
+            tokenizer,
+            evaluation_path,
+            args.tokenization_cache_directory,
+            max_context_length=args.max_context_length,
+            max_question_length=args.max_question_length,
+        )
+
+    pool = None
+    worker_stats = defaultdict(Counter)
+    if args.num_workers > 1:
+        if device.type != "cpu":
+            raise Exception("Multiple workers are only supported for cpu inference.")
+        pool = make_worker_pool(
+            args.hf_model_name_or_path,
+            args.use_fast_tokenizer,
+            model,
+            args.num_workers,
+            num_threads_per_worker=args.num_threads_per_worker,
+            quantize=args.quantize if args.quantize == "int8" else None,
+        )
+
+    start_time = time.time()
+    padding_stats = Counter()
+    num_predictions = sum(completed_question_ids.values())
+    num_new_predictions = 0
+    print(f"Saving predictions in {partial_output_path}.")
+    with open(partial_output_path, "a") as file:
+        for indexed_instances in chunks:
+            instances = [instance for _, instance in indexed_instances]
+            input_ids = None
+            if tokenization_cache is not None:
+                input_ids = [
+                    tokenization_cache[index] for index, _ in indexed_instances
+                ]
+            generated_predictions = generate_predictions(
+                tokenizer,
+                model,
+                instances,
+                device=device,
+                batch_size=args.batch_size,
+                max_tokens_per_batch=args.max_tokens_per_batch,
+                max_context_length=args.max_context_length,
+                max_question_length=args.max_question_length,
+                padding_stats=padding_stats,
+                show_progress=not args.stream_chunk_size,
+                pool=pool,
+                worker_stats=worker_stats,
+                input_ids=input_ids,
+                group_by_passage=args.group_by_passage,
+                max_generation_length=max_generation_length,
+            )
+            add_predicted_answers(instances, generated_predictions)
+            for instance in instances:
+                file.write(json.dumps(instance) + "\n")
+            file.flush()
+            num_predictions += len(instances)
+            num_new_predictions += len(instances)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    os.replace(partial_output_path, output_path)
+    print(f"Saved {num_predictions} predictions in {output_path}.")
+    report_padding_efficiency(padding_stats)
+    seconds = time.time() - start_time
+    print(
+        f"Predicted {num_new_predictions} instances in {round(seconds, 1)}s "
+        f"({round(num_new_predictions / max(seconds, 1e-6), 2)} instances/s)."
+    )
+    report_worker_throughput(worker_stats)
+
+    # Kept next to the predictions to compare the speed of different runs (e.g.
+    # quantized ones).
+    timing_path = os.path.splitext(output_path)[0] + PREDICTION_TIMING_SUFFIX
+    with open(timing_path, "w") as file:
+        json.dump(
+            {
+                "hf_model_name_or_path": args.hf_model_name_or_path,
+                "quantize": args.quantize,
+                "device": device.type,
+                "num_workers": args.num_workers,
+                "num_instances": num_new_predictions,
+                "seconds": round(seconds, 2),
+                "instances_per_second": round(
+                    num_new_predictions / max(seconds, 1e-6), 2
+                ),
+            },
+            file,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate predictions with one of the HF models on one of the datasets."
+    )
+    parser.add_argument("hf_model_name_or_path", type=str, help="hf_model_name_or_path")
+    parser.add_argument("evaluation_path", type=str, help="evaluation_path")
+    parser.add_argument("output_path", type=str, help="output_path")
+    add_prediction_arguments(parser)
+    args = parser.parse_args()
+
+    tokenizer, model, device = load_tokenizer_and_model(args)
+    predict_file(tokenizer, model, device, args.evaluation_path, args.output_path, args)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,51 @@
 import os
+import argparse
 import subprocess
+from collections import defaultdict
 
-from constants import ALL_MODEL_NAMES, EVALUATION_NAME_TO_FILEPATH
+from constants import (
+    ALL_MODEL_NAMES,
+    EVALUATION_NAME_TO_FILEPATH,
+    PARTIAL_PREDICTIONS_SUFFIX,
+    QUANTIZE_OPTIONS,
+)
 
 
 def main():
 
+    parser = argparse.ArgumentParser(description="Generate all predictions.")
+    parser.add_argument(
+        "--in_process",
+        action="store_true",
+        help="run the predictions in this process instead of a predict.py process per "
+        "file, so that each model is loaded only once for all of its evaluation files. "
+        "All options of predict.py are then accepted too.",
+        default=False,
+    )
+    args, _ = parser.parse_known_args()
+
+    if args.in_process:
+        # Only imported here as the default (subprocess) mode doesn't need torch, etc.
+        from predict import add_prediction_arguments, load_tokenizer_and_model, predict_file
+
+        add_prediction_arguments(parser)
+        args = parser.parse_args()
+    else:
+        parser.add_argument(
+            "--quantize",
+            type=str,
+            choices=QUANTIZE_OPTIONS,
+            help="quantize the models (see predict.py).",
+            default=None,
+        )
+        args = parser.parse_args()
+
+    predictions_directory = "predictions"
+    if args.quantize:
+        # The predictions of quantized models are kept separately, see summarize_results.py.
+        predictions_directory = os.path.join(predictions_directory, args.quantize)
+
+    model_path_to_jobs = defaultdict(list)
     for index, model_name in enumerate(ALL_MODEL_NAMES):
         print(f"\n\nWorking on model {index+1}/{len(ALL_MODEL_NAMES)} [{model_name}].")
 
@@ -24,7 +64,7 @@ def main():
             model_path = f"StonyBrookNLP/{model_with_data_name}"
 
             output_file_path = os.path.join(
-                "predictions", model_with_data_name + "__" + evaluation_name + ".jsonl"
+                predictions_directory, model_with_data_name + "__" + evaluation_name + ".jsonl"
             )
             command = " ".join(
                 [
@@ -34,6 +74,7 @@ def main():
                     evaluation_file_path,
                     output_file_path,
                 ]
+                + ([f"--quantize {args.quantize}"] if args.quantize else [])
             )
 
             if os.path.exists(output_file_path):
@@ -43,9 +84,30 @@ def main():
                 )
                 continue
 
+            if os.path.exists(output_file_path + PARTIAL_PREDICTIONS_SUFFIX):
+                print(
+                    f"Found partial predictions for {output_file_path}. "
+                    f"So resuming prediction."
+                )
+
+            if args.in_process:
+                model_path_to_jobs[model_path].append((evaluation_file_path, output_file_path))
+                continue
+
             print(command)
             subprocess.call(command.split())
 
+    # A model (e.g. teabreac-t5-3b-drop) is used for all the evaluation files of its
+    # dataset (e.g. drop_dev, drop_test, drop_cs and drop_bpb).
+    for model_path, jobs in model_path_to_jobs.items():
+        print(f"\n\nLoading {model_path} for {len(jobs)} evaluation files.")
+        args.hf_model_name_or_path = model_path
+        tokenizer, model, device = load_tokenizer_and_model(args)
+        for evaluation_file_path, output_file_path in jobs:
+            print(f"Predicting {evaluation_file_path} in {output_file_path}.")
+            predict_file(tokenizer, model, device, evaluation_file_path, output_file_path, args)
+        del tokenizer, model
+
 
 if __name__ == "__main__":
     main()
@@ -3,7 +3,7 @@ import json
 import os
 
 
-def predictions_to_drop_format(prediction_instances: List[Dict], output_path: str):
+def predictions_to_drop_json(prediction_instances: List[Dict]) -> Dict:
 
     official_predictions_json = {}
     for prediction_instance in prediction_instances:
@@ -16,12 +16,19 @@ def predictions_to_drop_format(prediction_instances: List[Dict], output_path: st
             prediction_obj = predicted_answers
         official_predictions_json[question_id] = prediction_obj
 
+    return official_predictions_json
+
+
+def predictions_to_drop_format(prediction_instances: List[Dict], output_path: str):
+
+    official_predictions_json = predictions_to_drop_json(prediction_instances)
+
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     with open(output_path, "w") as file:
         json.dump(official_predictions_json, file, indent=4)
 
 
-def predictions_to_tatqa_format(prediction_instances: List[Dict], output_path: str):
+def predictions_to_tatqa_json(prediction_instances: List[Dict]) -> Dict:
 
     official_predictions_json = {}
     for prediction_instance in prediction_instances:
@@ -45,6 +52,13 @@ def predictions_to_tatqa_format(prediction_instances: List[Dict], output_path: s
         prediction_obj = [metric_clipped_predicted_answers, metric]
         official_predictions_json[question_id] = prediction_obj
 
+    return official_predictions_json
+
+
+def predictions_to_tatqa_format(prediction_instances: List[Dict], output_path: str):
+
+    official_predictions_json = predictions_to_tatqa_json(prediction_instances)
+
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     with open(output_path, "w") as file:
         json.dump(official_predictions_json, file, indent=4)
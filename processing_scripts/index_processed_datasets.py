@@ -0,0 +1,45 @@
+import os
+import glob
+
+from lib import INDEXED_DATASET_SUFFIX, iterate_jsonl, write_indexed_dataset
+
+
+def write_indexed_version(input_filepath: str) -> None:
+    output_filepath = os.path.splitext(input_filepath)[0] + INDEXED_DATASET_SUFFIX
+    write_indexed_dataset(iterate_jsonl(input_filepath), output_filepath)
+    input_size, output_size = os.path.getsize(input_filepath), os.path.getsize(output_filepath)
+    print(
+        f"{input_filepath}: {input_size / 2**20:.1f}MB -> "
+        f"{output_filepath}: {output_size / 2**20:.1f}MB"
+    )
+
+
+def main():
+    # Only imported here as preprocess_all imports this module too.
+    from processing_scripts.preprocess_all import update_stamp_indexed_outputs
+
+    # Optionally, writes an indexed version (see lib.write_indexed_dataset) next to each
+    # processed jsonl dataset. It can be passed to predict.py and evaluate.py in its place.
+
+    processed_data_directory = "processed_target_datasets"
+
+    if not os.path.exists(processed_data_directory):
+        raise Exception(
+            f"Processed data directory ({processed_data_directory}) not found. "
+            "Please generate or download it first."
+        )
+
+    input_filepaths = sorted(
+        glob.glob(os.path.join(processed_data_directory, "**", "*.jsonl"), recursive=True)
+    )
+    for input_filepath in input_filepaths:
+        write_indexed_version(input_filepath)
+
+    # They're made from the processed files the stamps (of preprocess_all.py) record, so
+    # they're recorded as up to date outputs too.
+    for output_directory in sorted(set(map(os.path.dirname, input_filepaths))):
+        update_stamp_indexed_outputs(output_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import os
+import glob
+import sys
+import argparse
+from typing import Dict
+
+from lib import read_json, read_jsonl, write_jsonl
+from processing_scripts.preprocess_tatqa import SET_NAMES, get_input_filepaths, get_passage_id
+
+
+def get_question_id_to_passage_id() -> Dict[str, str]:
+    question_id_to_passage_id = {}
+    for set_name in SET_NAMES:
+        (input_filepath,) = get_input_filepaths(set_name)
+        for data_object in read_json(input_filepath):
+            passage_id = get_passage_id(data_object)
+            for question in data_object["questions"]:
+                question_id_to_passage_id[question["uid"]] = passage_id
+    return question_id_to_passage_id
+
+
+def main():
+    # Checks that the passage_ids of previously processed TAT-QA files (or predictions on
+    # them) are the ones preprocess_tatqa.py gives now, and optionally rewrites them so.
+    parser = argparse.ArgumentParser(description="Verify or remap TAT-QA passage_ids.")
+    parser.add_argument(
+        "file_paths",
+        type=str,
+        nargs="*",
+        help="processed TAT-QA (or prediction) jsonl files. "
+        "Defaults to those in processed_target_datasets/tatqa.",
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        choices=("verify", "remap"),
+        default="verify",
+        help="verify: only report the files with outdated passage_ids. "
+        "remap: also rewrite them with the current ones.",
+    )
+    args = parser.parse_args()
+
+    file_paths = args.file_paths or sorted(
+        glob.glob(os.path.join("processed_target_datasets", "tatqa", "*.jsonl"))
+    )
+    if not file_paths:
+        sys.exit("No files to migrate.")
+
+    question_id_to_passage_id = get_question_id_to_passage_id()
+
+    num_outdated_files = 0
+    for file_path in file_paths:
+        instances = read_jsonl(file_path)
+        unknown_question_ids = [
+            instance["question_id"]
+            for instance in instances
+            if instance["question_id"] not in question_id_to_passage_id
+        ]
+        if unknown_question_ids:
+            sys.exit(
+                f"{file_path} has {len(unknown_question_ids)} questions not in the raw "
+                f"TAT-QA files (e.g., {unknown_question_ids[0]})."
+            )
+
+        old_to_new_passage_ids = {
+            instance["passage_id"]: question_id_to_passage_id[instance["question_id"]]
+            for instance in instances
+            if instance["passage_id"] != question_id_to_passage_id[instance["question_id"]]
+        }
+        if not old_to_new_passage_ids:
+            print(f"{file_path}: all {len(instances)} passage_ids are up to date.")
+            continue
+
+        num_outdated_files += 1
+        print(
+            f"{file_path}: {len(old_to_new_passage_ids)} passage_ids are outdated "
+            f"(e.g., {next(iter(old_to_new_passage_ids.items()))})."
+        )
+        if args.mode == "remap":
+            for instance in instances:
+                instance["passage_id"] = question_id_to_passage_id[instance["question_id"]]
+            write_jsonl(instances, file_path + ".tmp")
+            os.replace(file_path + ".tmp", file_path)
+
+    if num_outdated_files and args.mode == "verify":
+        sys.exit(
+            f"{num_outdated_files} of {len(file_paths)} files have outdated passage_ids. "
+            "Rerun with --mode remap to rewrite them."
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from types import ModuleType
+import importlib
+import argparse
+import glob
+import json
+import sys
+import time
+import os
+
+import lib
+import constants
+from lib import INDEXED_DATASET_SUFFIX, hash_file, read_json
+from processing_scripts.index_processed_datasets import write_indexed_version
+
+# Each of these has a processing_scripts/preprocess_{dataset_name}.py with SET_NAMES,
+# output_directory, get_input_filepaths(set_name), process(set_name, chunk_index, num_chunks)
+# and write_processed_instances(set_name, ...).
+DATASET_NAMES = [
+    "drop",
+    "drop_bpb",
+    "drop_cs",
+    "tatqa",
+    "iirc_gold",
+    "iirc_retrieved",
+    "numglue",
+]
+
+
+def import_processing_script(dataset_name: str) -> ModuleType:
+    return importlib.import_module(f"processing_scripts.preprocess_{dataset_name}")
+
+
+# Stamp written in the output directory of a dataset once all its sets are written. It
+# records what they were made from, so that they're only remade when any of it changes.
+STAMP_FILENAME = ".preprocess_stamp.json"
+
+# Modules that all the processing scripts share, whose changes can change their outputs.
+SHARED_MODULE_PATHS = [lib.__file__, constants.__file__]
+
+
+def get_file_stamps(
+    file_paths: List[str], previous_file_stamps: Dict[str, Dict]
+) -> Optional[Dict[str, Dict]]:
+    # Files are only rehashed if their size or modification time changed since the
+    # previous stamp. Returns None if any of them doesn't exist.
+    file_stamps = {}
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            return None
+        stat = os.stat(file_path)
+        previous_file_stamp = previous_file_stamps.get(file_path, {})
+        if (
+            previous_file_stamp.get("size") == stat.st_size
+            and previous_file_stamp.get("mtime_ns") == stat.st_mtime_ns
+        ):
+            file_hash = previous_file_stamp["hash"]
+        else:
+            file_hash = hash_file(file_path)
+        file_stamps[file_path] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "hash": file_hash,
+        }
+    return file_stamps
+
+
+def get_output_stamps(output_directory: str) -> Dict[str, Dict]:
+    # The processed sets and their indexed versions (see index_processed_datasets.py).
+    # Any rewrite of them, e.g., by running a processing script on its own, changes
+    # their modification time and so invalidates the stamp.
+    output_filepaths = glob.glob(os.path.join(output_directory, "*.jsonl")) + glob.glob(
+        os.path.join(output_directory, "*" + INDEXED_DATASET_SUFFIX)
+    )
+    output_stamps = {}
+    for output_filepath in sorted(output_filepaths):
+        stat = os.stat(output_filepath)
+        output_stamps[output_filepath] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return output_stamps
+
+
+def read_stamp(output_directory: str) -> Dict[str, Any]:
+    stamp_path = os.path.join(output_directory, STAMP_FILENAME)
+    return read_json(stamp_path) if os.path.exists(stamp_path) else {}
+
+
+def make_stamp(script: ModuleType, previous_stamp: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # The outputs of a dataset are determined by its raw input files, the code of its
+    # processing script (and of the modules it shares with the others) and the sets it's
+    # run on.
+    input_filepaths = [
+        input_filepath
+        for set_name in script.SET_NAMES
+        for input_filepath in script.get_input_filepaths(set_name)
+    ]
+    input_stamps = get_file_stamps(input_filepaths, previous_stamp.get("inputs", {}))
+    if input_stamps is None:
+        return None
+    return {
+        "code_hashes": {
+            os.path.relpath(code_path, os.path.dirname(lib.__file__)): hash_file(code_path)
+            for code_path in [script.__file__] + SHARED_MODULE_PATHS
+        },
+        "parameters": {"set_names": script.SET_NAMES},
+        "inputs": input_stamps,
+    }
+
+
+def is_up_to_date(
+    script: ModuleType, stamp: Optional[Dict[str, Any]], previous_stamp: Dict[str, Any]
+) -> bool:
+    if stamp is None or not previous_stamp:
+        return False
+    if (
+        stamp["code_hashes"] != previous_stamp.get("code_hashes")
+        or stamp["parameters"] != previous_stamp["parameters"]
+    ):
+        return False
+    input_hashes = {path: file_stamp["hash"] for path, file_stamp in stamp["inputs"].items()}
+    previous_input_hashes = {
+        path: file_stamp["hash"] for path, file_stamp in previous_stamp["inputs"].items()
+    }
+    if input_hashes != previous_input_hashes:
+        return False
+    return get_output_stamps(script.output_directory) == previous_stamp["outputs"]
+
+
+def write_stamp(output_directory: str, stamp: Dict[str, Any]) -> None:
+    stamp = dict(stamp)
+    stamp["outputs"] = get_output_stamps(output_directory)
+    stamp_path = os.path.join(output_directory, STAMP_FILENAME)
+    with open(stamp_path + ".tmp", "w") as file:
+        json.dump(stamp, file, indent=4)
+    os.replace(stamp_path + ".tmp", stamp_path)
+
+
+def update_stamp_indexed_outputs(output_directory: str) -> None:
+    # Records the indexed versions written by index_processed_datasets.py, as long as
+    # the processed sets they're made from are still the ones the stamp records.
+    previous_stamp = read_stamp(output_directory)
+    if not previous_stamp:
+        return
+    output_stamps = get_output_stamps(output_directory)
+    processed_output_stamps = {
+        path: output_stamp
+        for path, output_stamp in output_stamps.items()
+        if not path.endswith(INDEXED_DATASET_SUFFIX)
+    }
+    previous_processed_output_stamps = {
+        path: output_stamp
+        for path, output_stamp in previous_stamp["outputs"].items()
+        if not path.endswith(INDEXED_DATASET_SUFFIX)
+    }
+    if processed_output_stamps == previous_processed_output_stamps:
+        write_stamp(output_directory, previous_stamp)
+
+
+def reindex_outputs(output_directory: str) -> None:
+    # Indexed versions of the previous processed sets would be stale, so they're made
+    # again from the new ones (or removed if their set isn't there anymore).
+    for indexed_filepath in sorted(
+        glob.glob(os.path.join(output_directory, "*" + INDEXED_DATASET_SUFFIX))
+    ):
+        input_filepath = os.path.splitext(indexed_filepath)[0] + ".jsonl"
+        if os.path.exists(input_filepath):
+            write_indexed_version(input_filepath)
+        else:
+            os.remove(indexed_filepath)
+
+
+def process_chunk(
+    dataset_name: str, set_name: str, chunk_index: int, num_chunks: int
+) -> List[Dict]:
+    return import_processing_script(dataset_name).process(set_name, chunk_index, num_chunks)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Preprocess (all) the target datasets.")
+    parser.add_argument(
+        "dataset_names",
+        type=str,
+        nargs="*",
+        default=DATASET_NAMES,
+        help=f"datasets to preprocess, from {DATASET_NAMES} (all of them by default).",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of processes to preprocess with. "
+        "Use 1 to preprocess everything one after another in this process.",
+    )
+    parser.add_argument(
+        "--num_chunks",
+        type=int,
+        default=1,
+        help="number of chunks (of consecutive documents) to split each set into, "
+        "which are processed in parallel and then put back together in order.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help="preprocess the datasets even if their raw inputs and processing scripts "
+        "haven't changed since they were last preprocessed.",
+    )
+    args = parser.parse_args()
+
+    unknown_dataset_names = sorted(set(args.dataset_names) - set(DATASET_NAMES))
+    if unknown_dataset_names:
+        sys.exit(f"Unknown dataset names: {unknown_dataset_names}. Choose from {DATASET_NAMES}.")
+
+    dataset_name_to_script = {
+        dataset_name: import_processing_script(dataset_name)
+        for dataset_name in args.dataset_names
+    }
+
+    dataset_name_to_stamp = {}
+    for dataset_name, script in list(dataset_name_to_script.items()):
+        previous_stamp = read_stamp(script.output_directory)
+        stamp = make_stamp(script, previous_stamp)
+        if not args.force and is_up_to_date(script, stamp, previous_stamp):
+            print(f"Skipping {dataset_name} as it's up to date.")
+            if stamp["inputs"] != previous_stamp["inputs"]:
+                # Only the modification times changed. Saves rehashing them next time.
+                write_stamp(script.output_directory, stamp)
+            del dataset_name_to_script[dataset_name]
+            continue
+        # It's rewritten only after all the sets are written again.
+        if previous_stamp:
+            os.remove(os.path.join(script.output_directory, STAMP_FILENAME))
+        dataset_name_to_stamp[dataset_name] = stamp
+
+    jobs = [
+        (dataset_name, set_name, chunk_index, args.num_chunks)
+        for dataset_name, script in dataset_name_to_script.items()
+        for set_name in script.SET_NAMES
+        for chunk_index in range(args.num_chunks)
+    ]
+    print(f"Preprocessing {len(dataset_name_to_script)} datasets in {len(jobs)} jobs.")
+
+    # The sets of a dataset are written in the parent in SET_NAMES order, as soon as all
+    # their chunks are done. It's what keeps the seeded shuffles of numglue reproducible.
+    chunk_results: Dict[Tuple[str, str], Dict[int, List[Dict]]] = {}
+    dataset_name_to_num_written_sets = {
+        dataset_name: 0 for dataset_name in dataset_name_to_script
+    }
+
+    def write_completed_sets(dataset_name: str) -> None:
+        script = dataset_name_to_script[dataset_name]
+        while dataset_name_to_num_written_sets[dataset_name] < len(script.SET_NAMES):
+            set_name = script.SET_NAMES[dataset_name_to_num_written_sets[dataset_name]]
+            chunk_index_to_instances = chunk_results.get((dataset_name, set_name), {})
+            if len(chunk_index_to_instances) < args.num_chunks:
+                break
+            processed_instances = [
+                processed_instance
+                for chunk_index in range(args.num_chunks)
+                for processed_instance in chunk_index_to_instances[chunk_index]
+            ]
+            print(f"Writing {dataset_name} {set_name}")
+            script.write_processed_instances(set_name, processed_instances)
+            del chunk_results[(dataset_name, set_name)]
+            dataset_name_to_num_written_sets[dataset_name] += 1
+        if dataset_name_to_num_written_sets[dataset_name] < len(script.SET_NAMES):
+            return
+        reindex_outputs(script.output_directory)
+        stamp = dataset_name_to_stamp[dataset_name]
+        if stamp:
+            write_stamp(script.output_directory, stamp)
+
+    def add_chunk_result(job: Tuple, processed_instances: List[Dict]) -> None:
+        dataset_name, set_name, chunk_index, _ = job
+        chunk_index_to_instances = chunk_results.setdefault((dataset_name, set_name), {})
+        chunk_index_to_instances[chunk_index] = processed_instances
+        write_completed_sets(dataset_name)
+
+    start_time = time.perf_counter()
+    failed_jobs = []
+    if args.num_workers == 1:
+        for job in jobs:
+            try:
+                processed_instances = process_chunk(*job)
+            except Exception as exception:
+                print(f"Preprocessing of {job[:3]} failed: {exception!r}")
+                failed_jobs.append(job)
+                continue
+            add_chunk_result(job, processed_instances)
+    else:
+        with ProcessPoolExecutor(max_workers=args.num_workers) as executor:
+            future_to_job = {executor.submit(process_chunk, *job): job for job in jobs}
+            for future in as_completed(future_to_job):
+                job = future_to_job[future]
+                try:
+                    processed_instances = future.result()
+                except Exception as exception:
+                    print(f"Preprocessing of {job[:3]} failed: {exception!r}")
+                    failed_jobs.append(job)
+                    continue
+                add_chunk_result(job, processed_instances)
+
+    seconds = time.perf_counter() - start_time
+    print(f"Preprocessed in {seconds:.1f}s.")
+    if failed_jobs:
+        sys.exit(
+            f"Preprocessing failed for {len(failed_jobs)} jobs (dataset, set, chunk): "
+            + ", ".join(str(job[:3]) for job in sorted(failed_jobs))
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,82 @@
 import os
+from typing import List, Dict
 
-from lib import read_json, write_jsonl
+from lib import read_json, write_jsonl, get_chunk_bounds
 
 
-def main():
+raw_data_directory = "raw_target_datasets"
+processed_data_directory = "processed_target_datasets"
 
-    raw_data_directory = "raw_target_datasets"
-    processed_data_directory = "processed_target_datasets"
+input_directory = os.path.join(raw_data_directory, "drop")
+output_directory = os.path.join(processed_data_directory, "drop")
 
-    if not os.path.exists(raw_data_directory):
-        raise Exception(
-            f"Raw data directory ({raw_data_directory}) not found. Please download it first."
-        )
+SET_NAMES = ["train", "dev", "test"]
 
-    input_directory = os.path.join(raw_data_directory, "drop")
-    output_directory = os.path.join(processed_data_directory, "drop")
-    os.makedirs(output_directory, exist_ok=True)
 
-    set_names = ["train", "dev", "test"]
-    for set_name in set_names:
-        print(f"Processing {set_name}")
+def get_input_filepaths(set_name: str) -> List[str]:
+    return [os.path.join(input_directory, f"drop_dataset_{set_name}.json")]
 
-        processed_instances = []
-
-        input_filepath = os.path.join(input_directory, f"drop_dataset_{set_name}.json")
-        output_filepath = os.path.join(output_directory, f"{set_name}.jsonl")
-
-        data_object = read_json(input_filepath)
-
-        for passage_id, passage_object in data_object.items():
-            passage = passage_object["passage"]
-            qa_pairs = passage_object["qa_pairs"]
-            for qa_pair in qa_pairs:
-                question_text = qa_pair["question"]
-                question_id = qa_pair["query_id"]
-
-                if set_name != "test":
-                    answers_object = qa_pair["answer"]
-                else:
-                    # answers are not available.
-                    answers_object = {
-                        "number": "",
-                        "date": {"day": "", "month": "", "year": ""},
-                        "spans": [],
-                    }
-
-                answers_objects = [answers_object]
-                if "validated_answers" in qa_pair:
-                    answers_objects.extend(qa_pair["validated_answers"])
-
-                processed_instance = {
-                    "passage_id": passage_id,
-                    "question_id": question_id,
-                    "question_text": question_text,
-                    "context_text": passage,
-                    "answers_objects": answers_objects,
+
+def process(set_name: str, chunk_index: int = 0, num_chunks: int = 1) -> List[Dict]:
+
+    processed_instances = []
+
+    (input_filepath,) = get_input_filepaths(set_name)
+
+    data_object = read_json(input_filepath)
+    passage_items = list(data_object.items())
+    start, end = get_chunk_bounds(len(passage_items), chunk_index, num_chunks)
+
+    for passage_id, passage_object in passage_items[start:end]:
+        passage = passage_object["passage"]
+        qa_pairs = passage_object["qa_pairs"]
+        for qa_pair in qa_pairs:
+            question_text = qa_pair["question"]
+            question_id = qa_pair["query_id"]
+
+            if set_name != "test":
+                answers_object = qa_pair["answer"]
+            else:
+                # answers are not available.
+                answers_object = {
+                    "number": "",
+                    "date": {"day": "", "month": "", "year": ""},
+                    "spans": [],
                 }
 
-                processed_instances.append(processed_instance)
+            answers_objects = [answers_object]
+            if "validated_answers" in qa_pair:
+                answers_objects.extend(qa_pair["validated_answers"])
+
+            processed_instance = {
+                "passage_id": passage_id,
+                "question_id": question_id,
+                "question_text": question_text,
+                "context_text": passage,
+                "answers_objects": answers_objects,
+            }
 
-        write_jsonl(processed_instances, output_filepath)
+            processed_instances.append(processed_instance)
+
+    return processed_instances
+
+
+def write_processed_instances(set_name: str, processed_instances: List[Dict]) -> None:
+    os.makedirs(output_directory, exist_ok=True)
+    output_filepath = os.path.join(output_directory, f"{set_name}.jsonl")
+    write_jsonl(processed_instances, output_filepath)
+
+
+def main():
+
+    if not os.path.exists(raw_data_directory):
+        raise Exception(
+            f"Raw data directory ({raw_data_directory}) not found. Please download it first."
+        )
+
+    for set_name in SET_NAMES:
+        print(f"Processing {set_name}")
+        write_processed_instances(set_name, process(set_name))
 
 
 if __name__ == "__main__":
@@ -1,26 +1,34 @@
 import os
+from typing import List, Dict
 
-from lib import read_json, write_jsonl
+from lib import read_json, write_jsonl, get_chunk_bounds
 
 
-def main():
+raw_data_directory = "raw_target_datasets"
+processed_data_directory = "processed_target_datasets"
+
+output_directory = os.path.join(processed_data_directory, "drop_bpb")
+
+SET_NAMES = ["validated_dev"]
 
-    raw_data_directory = "raw_target_datasets"
-    processed_data_directory = "processed_target_datasets"
 
-    input_filepath = os.path.join(
-        raw_data_directory, "drop_bpb", "drop_dev_contrast_set_sample_validated.json"
-    )
+def get_input_filepaths(set_name: str) -> List[str]:
+    return [
+        os.path.join(
+            raw_data_directory, "drop_bpb", "drop_dev_contrast_set_sample_validated.json"
+        )
+    ]
 
-    output_filepath = os.path.join(
-        processed_data_directory, "drop_bpb", "validated_dev.jsonl"
-    )
 
-    os.makedirs(os.path.dirname(output_filepath), exist_ok=True)
+def process(set_name: str, chunk_index: int = 0, num_chunks: int = 1) -> List[Dict]:
+
+    (input_filepath,) = get_input_filepaths(set_name)
 
     processed_instances = []
     data_object = read_json(input_filepath)
-    for passage_id, passage_object in data_object.items():
+    passage_items = list(data_object.items())
+    start, end = get_chunk_bounds(len(passage_items), chunk_index, num_chunks)
+    for passage_id, passage_object in passage_items[start:end]:
         passage = passage_object["passage"]
         qa_pairs = passage_object["qa_pairs"]
         for qa_pair in qa_pairs:
@@ -47,8 +55,19 @@ def main():
 
             processed_instances.append(processed_instance)
 
+    return processed_instances
+
+
+def write_processed_instances(set_name: str, processed_instances: List[Dict]) -> None:
+    os.makedirs(output_directory, exist_ok=True)
+    output_filepath = os.path.join(output_directory, f"{set_name}.jsonl")
     write_jsonl(processed_instances, output_filepath)
 
 
+def main():
+    for set_name in SET_NAMES:
+        write_processed_instances(set_name, process(set_name))
+
+
 if __name__ == "__main__":
     main()
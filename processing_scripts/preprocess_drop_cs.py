@@ -1,24 +1,31 @@
 import os
+from typing import List, Dict
 
-from lib import read_json, write_jsonl
+from lib import read_json, write_jsonl, get_chunk_bounds
 
 
-def main():
+raw_data_directory = "raw_target_datasets"
+processed_data_directory = "processed_target_datasets"
+
+output_directory = os.path.join(processed_data_directory, "drop_cs")
+
+SET_NAMES = ["test"]
+
+
+def get_input_filepaths(set_name: str) -> List[str]:
+    return [os.path.join(raw_data_directory, "drop_cs", "drop_contrast_sets_test.json")]
 
-    raw_data_directory = "raw_target_datasets"
-    processed_data_directory = "processed_target_datasets"
 
-    input_filepath = os.path.join(
-        raw_data_directory, "drop_cs", "drop_contrast_sets_test.json"
-    )
-    output_filepath = os.path.join(processed_data_directory, "drop_cs", "test.jsonl")
+def process(set_name: str, chunk_index: int = 0, num_chunks: int = 1) -> List[Dict]:
 
-    os.makedirs(os.path.dirname(output_filepath), exist_ok=True)
+    (input_filepath,) = get_input_filepaths(set_name)
 
     processed_instances = []
     data_object = read_json(input_filepath)
+    passage_items = list(data_object.items())
+    start, end = get_chunk_bounds(len(passage_items), chunk_index, num_chunks)
 
-    for passage_id, passage_object in data_object.items():
+    for passage_id, passage_object in passage_items[start:end]:
 
         passage = passage_object["passage"]
         qa_pairs = passage_object["qa_pairs"]
@@ -45,8 +52,19 @@ def main():
             }
             processed_instances.append(processed_instance)
 
+    return processed_instances
+
+
+def write_processed_instances(set_name: str, processed_instances: List[Dict]) -> None:
+    os.makedirs(output_directory, exist_ok=True)
+    output_filepath = os.path.join(output_directory, f"{set_name}.jsonl")
     write_jsonl(processed_instances, output_filepath)
 
 
+def main():
+    for set_name in SET_NAMES:
+        write_processed_instances(set_name, process(set_name))
+
+
 if __name__ == "__main__":
     main()
@@ -2,75 +2,86 @@
 import uuid
 
 import os
-from lib import read_json, write_jsonl
+from typing import List, Dict
 
+from lib import read_json, write_jsonl, get_chunk_bounds
 
-def main():
 
-    raw_data_directory = "raw_target_datasets"
-    processed_data_directory = "processed_target_datasets"
+raw_data_directory = "raw_target_datasets"
+processed_data_directory = "processed_target_datasets"
+
+input_directory = os.path.join(raw_data_directory, "iirc")
+output_directory = os.path.join(processed_data_directory, "iirc_gold")
+
+SET_NAMES = ["train", "dev", "test"]
+
+
+def get_input_filepaths(set_name: str) -> List[str]:
+    return [os.path.join(input_directory, f"{set_name}.json")]
+
+
+def process(set_name: str, chunk_index: int = 0, num_chunks: int = 1) -> List[Dict]:
+
+    processed_instances = []
+
+    (input_filepath,) = get_input_filepaths(set_name)
+
+    data_objects = read_json(input_filepath)
+    start, end = get_chunk_bounds(len(data_objects), chunk_index, num_chunks)
+
+    for passage_index, data_object in enumerate(data_objects[start:end], start):
+        for question_object in data_object["questions"]:
+
+            # The test set doesn't have qids, so we generate a random unique
+            # id at runtime.
+            question_id = question_object.get("qid", uuid.uuid4().hex)
 
-    input_directory = os.path.join(raw_data_directory, "iirc")
-    output_directory = os.path.join(processed_data_directory, "iirc_gold")
+            contexts = question_object["context"]
+            passage_id = str(passage_index)
+
+            context_text = " \n ".join(
+                [context["passage"] + ": " + context["text"] for context in contexts]
+            )
+
+            question_text = question_object["question"]
+            answer_object = question_object["answer"]
+
+            if answer_object["type"] == "none":
+                answer_list = ["none"]
+            elif answer_object["type"] == "span":
+                answer_list = [
+                    "#".join([a["text"] for a in answer_object["answer_spans"]]).strip()
+                ]
+            elif answer_object["type"] in ["binary", "value"]:
+                answer_list = [answer_object["answer_value"].strip()]
+            else:
+                raise Exception("Unknown answer type.")
+
+            answer_type = answer_object["type"]
+            processed_instance = {
+                "passage_id": passage_id,
+                "question_id": question_id,
+                "question_text": question_text,
+                "context_text": context_text,
+                "answer_list": answer_list,
+                "answer_type": answer_type,
+            }
+
+            processed_instances.append(processed_instance)
+
+    return processed_instances
+
+
+def write_processed_instances(set_name: str, processed_instances: List[Dict]) -> None:
     os.makedirs(output_directory, exist_ok=True)
+    output_filepath = os.path.join(output_directory, f"{set_name}.jsonl")
+    write_jsonl(processed_instances, output_filepath)
 
-    set_names = ["train", "dev", "test"]
-    for set_name in set_names:
-        print(f"Processing {set_name}")
 
-        processed_instances = []
-
-        input_filepath = os.path.join(input_directory, f"{set_name}.json")
-        output_filepath = os.path.join(output_directory, f"{set_name}.jsonl")
-
-        data_objects = read_json(input_filepath)
-
-        for passage_index, data_object in enumerate(data_objects):
-            for question_object in data_object["questions"]:
-
-                # The test set doesn't have qids, so we generate a random unique
-                # id at runtime.
-                question_id = question_object.get("qid", uuid.uuid4().hex)
-
-                contexts = question_object["context"]
-                passage_id = str(passage_index)
-
-                context_text = " \n ".join(
-                    [
-                        context["passage"] + ": " + context["text"]
-                        for context in contexts
-                    ]
-                )
-
-                question_text = question_object["question"]
-                answer_object = question_object["answer"]
-
-                if answer_object["type"] == "none":
-                    answer_list = ["none"]
-                elif answer_object["type"] == "span":
-                    answer_list = [
-                        "#".join(
-                            [a["text"] for a in answer_object["answer_spans"]]
-                        ).strip()
-                    ]
-                elif answer_object["type"] in ["binary", "value"]:
-                    answer_list = [answer_object["answer_value"].strip()]
-                else:
-                    raise Exception("Unknown answer type.")
-
-                answer_type = answer_object["type"]
-                processed_instance = {
-                    "passage_id": passage_id,
-                    "question_id": question_id,
-                    "question_text": question_text,
-                    "context_text": context_text,
-                    "answer_list": answer_list,
-                    "answer_type": answer_type,
-                }
-
-                processed_instances.append(processed_instance)
-
-        write_jsonl(processed_instances, output_filepath)
+def main():
+    for set_name in SET_NAMES:
+        print(f"Processing {set_name}")
+        write_processed_instances(set_name, process(set_name))
 
 
 if __name__ == "__main__":
@@ -1,134 +1,231 @@
 # Mostly taken from iirc_retrieval_dataset.py from PreaSM code.
+from collections import defaultdict
+from array import array
+from typing import List, Dict, Optional
 import uuid
+import json
 import os
 
-from lib import read_json, read_jsonl, write_jsonl
-
-
-def main():
-
-    raw_data_directory = "raw_target_datasets"
-    processed_data_directory = "processed_target_datasets"
-
-    input_directory = os.path.join(raw_data_directory, "iirc")
-    output_directory = os.path.join(processed_data_directory, "iirc_retrieved")
-    os.makedirs(output_directory, exist_ok=True)
-
-    set_names = ["train", "dev", "test"]
-    for set_name in set_names:
-        print(f"Processing {set_name}")
-
-        if set_name in ["dev", "test"]:
-            dev_test_retrieval_filepath = os.path.join(
-                raw_data_directory, "iirc", f"{set_name}_retrieved.jsonl"
-            )
-            all_question_retrieval_data = read_jsonl(dev_test_retrieval_filepath)
-            all_question_retrieval_data_dict = {}
-            for index, question_retrieval_data in enumerate(
-                all_question_retrieval_data
+from lib import read_json, write_jsonl, get_chunk_bounds
+
+
+raw_data_directory = "raw_target_datasets"
+processed_data_directory = "processed_target_datasets"
+
+input_directory = os.path.join(raw_data_directory, "iirc")
+output_directory = os.path.join(processed_data_directory, "iirc_retrieved")
+
+SET_NAMES = ["train", "dev", "test"]
+
+
+class RetrievalIndex:
+    """
+    Looks up the retrieval results of questions in a (large) {set}_retrieved.jsonl file
+    without loading it in memory. Only the byte offsets of its lines are held, and a line
+    is parsed when it's looked up.
+
+    The lines are expected to be in the order of the questions. If the line at a question's
+    position is of another question, it's looked up by its question id (if the lines have
+    a qid) or by its question text instead.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self._file = open(file_path, "rb")
+        self._offsets = array("q")
+        offset = 0
+        for line in self._file:
+            if line.strip():
+                self._offsets.append(offset)
+            offset += len(line)
+        self._question_id_to_offset = None
+        self._question_text_to_offsets = None
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _read(self, offset: int) -> Dict:
+        self._file.seek(offset)
+        return json.loads(self._file.readline())
+
+    def _build_question_indices(self) -> None:
+        # Only needed (and so built) once the lines are found out of order.
+        self._question_id_to_offset = {}
+        self._question_text_to_offsets = defaultdict(list)
+        for offset in self._offsets:
+            question_retrieval_data = self._read(offset)
+            question_id = question_retrieval_data.get("qid")
+            if question_id is not None:
+                self._question_id_to_offset[question_id] = offset
+            self._question_text_to_offsets[question_retrieval_data["question"]].append(offset)
+
+    def find(self, index: int, question_id: str, question_text: str) -> Optional[Dict]:
+        if index < len(self._offsets):
+            question_retrieval_data = self._read(self._offsets[index])
+            if question_retrieval_data["question"] == question_text and (
+                question_retrieval_data.get("qid", question_id) == question_id
             ):
-                all_question_retrieval_data_dict[index] = question_retrieval_data
-
-        processed_instances = []
-
-        input_filepath = os.path.join(input_directory, f"{set_name}.json")
-        output_filepath = os.path.join(output_directory, f"{set_name}.jsonl")
-
-        data_objects = read_json(input_filepath)
-
-        global_index = 0
-        for passage_index, data_object in enumerate(data_objects):
-            for question_object in data_object["questions"]:
-
-                question_id = question_object.get("qid", uuid.uuid4().hex)
-                question_text = question_object["question"]
-
-                contexts = question_object["context"]
-                passage_id = str(passage_index)
-
-                main_passage = data_object["title"] + ": " + data_object["text"]
-
-                if set_name == "train":
-
-                    gold_sentences = [
-                        c["passage"] + ": " + c["text"]
-                        for c in contexts
-                        if c["passage"] != "main"
-                    ]
-                    context_text = (
-                        "Links: \n "
-                        + "\n".join(gold_sentences)
-                        + " \n Main: \n "
-                        + main_passage
-                    )
-
+                return question_retrieval_data
+
+        if self._question_id_to_offset is None:
+            self._build_question_indices()
+        if question_id in self._question_id_to_offset:
+            question_retrieval_data = self._read(self._question_id_to_offset[question_id])
+            if question_retrieval_data["question"] == question_text:
+                return question_retrieval_data
+            return None
+        offsets = self._question_text_to_offsets.get(question_text, [])
+        if len(offsets) == 1:  # Otherwise, it's ambiguous.
+            return self._read(offsets[0])
+        return None
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def get_input_filepaths(set_name: str) -> List[str]:
+    input_filepaths = [os.path.join(input_directory, f"{set_name}.json")]
+    if set_name in ["dev", "test"]:
+        input_filepaths.append(os.path.join(input_directory, f"{set_name}_retrieved.jsonl"))
+    return input_filepaths
+
+
+def process(set_name: str, chunk_index: int = 0, num_chunks: int = 1) -> List[Dict]:
+
+    input_filepath, *retrieval_filepaths = get_input_filepaths(set_name)
+
+    if set_name in ["dev", "test"]:
+        (dev_test_retrieval_filepath,) = retrieval_filepaths
+        retrieval_index = RetrievalIndex(dev_test_retrieval_filepath)
+    # Questions without (matching) retrieval results and retrieved passages that aren't
+    # links of the main passage are reported at the end instead of failing.
+    missing_retrieval_question_ids = []
+    unknown_link_titles = []
+
+    processed_instances = []
+
+    data_objects = read_json(input_filepath)
+    start, end = get_chunk_bounds(len(data_objects), chunk_index, num_chunks)
+
+    # The retrieval data has one line per question of the whole set.
+    global_index = sum(len(data_object["questions"]) for data_object in data_objects[:start])
+    for passage_index, data_object in enumerate(data_objects[start:end], start):
+        links = {l["target"].lower(): l["target"] for l in data_object["links"]}
+        for question_object in data_object["questions"]:
+
+            question_id = question_object.get("qid", uuid.uuid4().hex)
+            question_text = question_object["question"]
+
+            contexts = question_object["context"]
+            passage_id = str(passage_index)
+
+            main_passage = data_object["title"] + ": " + data_object["text"]
+
+            if set_name == "train":
+
+                gold_sentences = [
+                    c["passage"] + ": " + c["text"]
+                    for c in contexts
+                    if c["passage"] != "main"
+                ]
+                context_text = (
+                    "Links: \n "
+                    + "\n".join(gold_sentences)
+                    + " \n Main: \n "
+                    + main_passage
+                )
+
+            else:
+
+                question_retrieval_data = retrieval_index.find(
+                    global_index, question_id, question_text
+                )
+                if question_retrieval_data is None:
+                    missing_retrieval_question_ids.append(question_id)
+                    predicted_link_name_sent_list = []
                 else:
-
-                    question_retrieval_data = all_question_retrieval_data_dict[
-                        global_index
-                    ]
-                    assert (
-                        question_retrieval_data["question"]
-                        == question_object["question"]
-                    )
-
-                    retrieved_sentences = []
-                    for retrieved_context in question_retrieval_data[
+                    predicted_link_name_sent_list = question_retrieval_data[
                         "context_retrieval"
-                    ]["predicted_link_name_sent_list"]:
-                        sentence_text = retrieved_context["sent"]
-                        if sentence_text[:12] == "Introduction":
-                            # remove the prefix
-                            sentence_text = "\n\n".join(sentence_text.split("\n\n")[1:])
-                        sentence = {
-                            "passage": retrieved_context["title"],
-                            "text": sentence_text,
-                        }
-                        retrieved_sentences.append(sentence)
-
-                    links = {
-                        l["target"].lower(): l["target"] for l in data_object["links"]
+                    ]["predicted_link_name_sent_list"]
+
+                retrieved_sentences = []
+                for retrieved_context in predicted_link_name_sent_list:
+                    sentence_text = retrieved_context["sent"]
+                    if sentence_text[:12] == "Introduction":
+                        # remove the prefix
+                        sentence_text = "\n\n".join(sentence_text.split("\n\n")[1:])
+                    sentence = {
+                        "passage": retrieved_context["title"],
+                        "text": sentence_text,
                     }
-                    retrieved_sentences = [
-                        links[r["passage"]] + ": " + r["text"].replace("\n", " ")
-                        for r in retrieved_sentences
-                        if "NULL" not in r["text"]
-                    ]
-                    context_text = (
-                        "Links: \n "
-                        + "\n".join(retrieved_sentences)
-                        + " \n Main: \n "
-                        + main_passage
-                    )
-
-                answer_object = question_object["answer"]
-                if answer_object["type"] == "none":
-                    answer_list = ["none"]
-                elif answer_object["type"] == "span":
-                    answer_list = [
-                        "#".join(
-                            [a["text"] for a in answer_object["answer_spans"]]
-                        ).strip()
-                    ]
-                elif answer_object["type"] in ["binary", "value"]:
-                    answer_list = [answer_object["answer_value"].strip()]
-                else:
-                    raise Exception("Unknown answer type.")
-
-                answer_type = answer_object["type"]
-                processed_instance = {
-                    "passage_id": passage_id,
-                    "question_id": question_id,
-                    "question_text": question_text,
-                    "context_text": context_text,
-                    "answer_list": answer_list,
-                    "answer_type": answer_type,
-                }
-
-                processed_instances.append(processed_instance)
-                global_index += 1
-
-        write_jsonl(processed_instances, output_filepath)
+                    retrieved_sentences.append(sentence)
+
+                for r in retrieved_sentences:
+                    if "NULL" not in r["text"] and r["passage"] not in links:
+                        unknown_link_titles.append((question_id, r["passage"]))
+                retrieved_sentences = [
+                    links.get(r["passage"], r["passage"]) + ": " + r["text"].replace("\n", " ")
+                    for r in retrieved_sentences
+                    if "NULL" not in r["text"]
+                ]
+                context_text = (
+                    "Links: \n "
+                    + "\n".join(retrieved_sentences)
+                    + " \n Main: \n "
+                    + main_passage
+                )
+
+            answer_object = question_object["answer"]
+            if answer_object["type"] == "none":
+                answer_list = ["none"]
+            elif answer_object["type"] == "span":
+                answer_list = [
+                    "#".join([a["text"] for a in answer_object["answer_spans"]]).strip()
+                ]
+            elif answer_object["type"] in ["binary", "value"]:
+                answer_list = [answer_object["answer_value"].strip()]
+            else:
+                raise Exception("Unknown answer type.")
+
+            answer_type = answer_object["type"]
+            processed_instance = {
+                "passage_id": passage_id,
+                "question_id": question_id,
+                "question_text": question_text,
+                "context_text": context_text,
+                "answer_list": answer_list,
+                "answer_type": answer_type,
+            }
+
+            processed_instances.append(processed_instance)
+            global_index += 1
+
+    if set_name in ["dev", "test"]:
+        retrieval_index.close()
+    if missing_retrieval_question_ids:
+        print(
+            f"No retrieval results found for {len(missing_retrieval_question_ids)} questions "
+            f"of {set_name} (e.g., {missing_retrieval_question_ids[:5]}). "
+            "They have no retrieved links."
+        )
+    if unknown_link_titles:
+        print(
+            f"{len(unknown_link_titles)} retrieved passages of {set_name} aren't links of the "
+            f"main passage (e.g., {unknown_link_titles[:5]}). Their titles are used as is."
+        )
+
+    return processed_instances
+
+
+def write_processed_instances(set_name: str, processed_instances: List[Dict]) -> None:
+    os.makedirs(output_directory, exist_ok=True)
+    output_filepath = os.path.join(output_directory, f"{set_name}.jsonl")
+    write_jsonl(processed_instances, output_filepath)
+
+
+def main():
+    for set_name in SET_NAMES:
+        print(f"Processing {set_name}")
+        write_processed_instances(set_name, process(set_name))
 
 
 if __name__ == "__main__":
@@ -1,92 +1,113 @@
 from collections import defaultdict
+from typing import List, Dict
 import random
 import os
 
-from lib import read_json, write_jsonl
+from lib import read_json, write_jsonl, get_chunk_bounds
 
 
-random.seed(13370)
+raw_data_directory = "raw_target_datasets"
+processed_data_directory = "processed_target_datasets"
 
+input_directory = os.path.join(raw_data_directory, "numglue")
+output_directory = os.path.join(processed_data_directory, "numglue")
 
-def main():
+SET_NAMES = ["train", "dev", "test"]
+
+# Same sequence of shuffles as seeding the global random with 13370 on import did, as
+# long as write_processed_instances is called for the sets in SET_NAMES order.
+shuffle_random = random.Random(13370)
+
+reasoning_name_to_type = {
+    "math_application_chemistry": "type_2",
+    "math_application_physics": "type_2",
+    "nli_stresstest": "type_7",
+    "nli_awpnli": "type_7",
+    "nli_newsnli": "type_7",
+    "nli_rte_quant": "type_7",
+    "nli_redditnli": "type_7",
+    "missing_numerical_knowledge": "type_1",
+    "arithmetic_word_problem": "type_8",
+    "quantitative_comparison": "type_3",
+    "completion": "type_4",
+    "trainrc_explicit": "type_5",
+    "devrc_explicit": "type_5",
+    "trainrc_implicit": "type_6",
+    "devrc_implicit": "type_6",
+}
+
+
+def get_input_filepaths(set_name: str) -> List[str]:
+    return [os.path.join(input_directory, f"drop_format_{set_name}.json")]
+
+
+def process(set_name: str, chunk_index: int = 0, num_chunks: int = 1) -> List[Dict]:
+
+    processed_instances = []
+
+    (input_filepath,) = get_input_filepaths(set_name)
+
+    data_object = read_json(input_filepath)
+    passage_items = list(data_object.items())
+    start, end = get_chunk_bounds(len(passage_items), chunk_index, num_chunks)
+
+    for passage_id, passage_object in passage_items[start:end]:
+        passage = passage_object["passage"]
+        qa_pairs = passage_object["qa_pairs"]
+        for qa_pair in qa_pairs:
+            question_text = qa_pair["question"]
+            answers_object = qa_pair["answer"]
+            question_id = qa_pair["query_id"]
 
-    raw_data_directory = "raw_target_datasets"
-    processed_data_directory = "processed_target_datasets"
+            answers_objects = [answers_object]
+            if "validated_answers" in qa_pair:
+                answers_objects.extend(qa_pair["validated_answers"])
 
-    input_directory = os.path.join(raw_data_directory, "numglue")
-    output_directory = os.path.join(processed_data_directory, "numglue")
+            reasoning_name = "_".join(passage_id.split("_")[:-1]).lower()
+            reasoning_type = reasoning_name_to_type[reasoning_name]
+            processed_instance = {
+                "reasoning_type": reasoning_type,
+                "passage_id": passage_id,
+                "question_id": question_id,
+                "question_text": question_text,
+                "context_text": passage,
+                "answers_objects": answers_objects,
+            }
+
+            processed_instances.append(processed_instance)
+
+    return processed_instances
+
+
+def write_processed_instances(set_name: str, processed_instances: List[Dict]) -> None:
     os.makedirs(output_directory, exist_ok=True)
+    output_filepath = os.path.join(output_directory, f"{set_name}.jsonl")
 
-    reasoning_name_to_type = {
-        "math_application_chemistry": "type_2",
-        "math_application_physics": "type_2",
-        "nli_stresstest": "type_7",
-        "nli_awpnli": "type_7",
-        "nli_newsnli": "type_7",
-        "nli_rte_quant": "type_7",
-        "nli_redditnli": "type_7",
-        "missing_numerical_knowledge": "type_1",
-        "arithmetic_word_problem": "type_8",
-        "quantitative_comparison": "type_3",
-        "completion": "type_4",
-        "trainrc_explicit": "type_5",
-        "devrc_explicit": "type_5",
-        "trainrc_implicit": "type_6",
-        "devrc_implicit": "type_6",
-    }
-
-    set_names = ["train", "dev", "test"]
-    for set_name in set_names:
-        print(f"Processing {set_name}")
+    reasoning_type_to_processed_instances = defaultdict(list)
+    for processed_instance in processed_instances:
+        reasoning_type_to_processed_instances[processed_instance["reasoning_type"]].append(
+            processed_instance
+        )
 
-        processed_instances = []
-        reasoning_type_to_processed_instances = defaultdict(list)
-
-        input_filepath = os.path.join(input_directory, f"drop_format_{set_name}.json")
-        output_filepath = os.path.join(output_directory, f"{set_name}.jsonl")
-
-        data_object = read_json(input_filepath)
-
-        for passage_id, passage_object in data_object.items():
-            passage = passage_object["passage"]
-            qa_pairs = passage_object["qa_pairs"]
-            for qa_pair in qa_pairs:
-                question_text = qa_pair["question"]
-                answers_object = qa_pair["answer"]
-                question_id = qa_pair["query_id"]
-
-                answers_objects = [answers_object]
-                if "validated_answers" in qa_pair:
-                    answers_objects.extend(qa_pair["validated_answers"])
-
-                reasoning_name = "_".join(passage_id.split("_")[:-1]).lower()
-                reasoning_type = reasoning_name_to_type[reasoning_name]
-                processed_instance = {
-                    "reasoning_type": reasoning_type,
-                    "passage_id": passage_id,
-                    "question_id": question_id,
-                    "question_text": question_text,
-                    "context_text": passage,
-                    "answers_objects": answers_objects,
-                }
-
-                processed_instances.append(processed_instance)
-                reasoning_type_to_processed_instances[reasoning_type].append(
-                    processed_instance
-                )
-
-        random.shuffle(processed_instances)
-        write_jsonl(processed_instances, output_filepath)
-
-        for (
-            reasoning_type,
-            _processed_instances,
-        ) in reasoning_type_to_processed_instances.items():
-            random.shuffle(_processed_instances)
-            _output_filepath = os.path.join(
-                output_directory, f"{reasoning_type}_{set_name}.jsonl"
-            )
-            write_jsonl(_processed_instances, _output_filepath)
+    processed_instances = list(processed_instances)
+    shuffle_random.shuffle(processed_instances)
+    write_jsonl(processed_instances, output_filepath)
+
+    for (
+        reasoning_type,
+        _processed_instances,
+    ) in reasoning_type_to_processed_instances.items():
+        shuffle_random.shuffle(_processed_instances)
+        _output_filepath = os.path.join(
+            output_directory, f"{reasoning_type}_{set_name}.jsonl"
+        )
+        write_jsonl(_processed_instances, _output_filepath)
+
+
+def main():
+    for set_name in SET_NAMES:
+        print(f"Processing {set_name}")
+        write_processed_instances(set_name, process(set_name))
 
 
 if __name__ == "__main__":
@@ -2,11 +2,13 @@
 import os
 from typing import List, Dict
 
+import numpy as np
+import scipy.sparse
 from tqdm import tqdm
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 from sklearn.metrics.pairwise import linear_kernel
 
-from lib import read_json, write_jsonl, hash_object
+from lib import read_json, write_jsonl, hash_object, get_chunk_bounds
 from constants import DF_COL_DELIMITER, DF_ROW_DELIMITER
 
 
@@ -25,99 +27,197 @@ def get_order_by_tf_idf(
     return [sorted_order[index] for index in idx]
 
 
-def main():
-
-    raw_data_directory = "raw_target_datasets"
-    processed_data_directory = "processed_target_datasets"
-
-    input_directory = os.path.join(raw_data_directory, "tatqa")
-    output_directory = os.path.join(processed_data_directory, "tatqa")
-    os.makedirs(output_directory, exist_ok=True)
-
-    set_names = ["train", "dev", "test"]
-    for set_name in set_names:
-        print(f"Processing {set_name}")
-
-        processed_instances = []
-
-        input_filepath = os.path.join(input_directory, f"tatqa_dataset_{set_name}.json")
-        output_filepath = os.path.join(output_directory, f"{set_name}.jsonl")
-
-        data_objects = read_json(input_filepath)
-
-        for data_object in tqdm(data_objects):
-
-            table = data_object["table"]
-            paragraphs = data_object["paragraphs"]
-            questions = data_object["questions"]
-
-            table_text = f" {DF_COL_DELIMITER} ".join(
-                [
-                    f" {DF_ROW_DELIMITER} ".join([e.strip() for e in row_object])
-                    for row_object in table["table"]
-                ]
+# Similarities closer than this may be ordered differently by get_order_by_tf_idf, due to
+# floating point differences, so such questions are ranked with it instead.
+NEAR_TIE_TOLERANCE = 1e-9
+
+
+def get_orders_by_tf_idf(
+    questions: List[str], order_to_paragraph_texts: Dict[str, List]
+) -> List[List[str]]:
+    """
+    Same as calling get_order_by_tf_idf for each of the questions, but the terms are counted
+    once for all of them, and they're all scored together with sparse matrix products.
+    """
+    sorted_order = list(order_to_paragraph_texts.keys())
+    paragraph_texts = list(order_to_paragraph_texts.values())
+    if not sorted_order or not questions:
+        return [[] for _ in questions]
+
+    counts = CountVectorizer().fit_transform(paragraph_texts + questions).astype(np.float64)
+    paragraph_counts = counts[: len(sorted_order)]
+    question_counts = counts[len(sorted_order) :]
+
+    # For each question, TfidfVectorizer is fit on the question and the paragraphs, so the
+    # (smoothed) idf of a term depends on whether that question has it or not.
+    num_documents = len(sorted_order) + 1
+    paragraph_document_frequencies = np.bincount(
+        paragraph_counts.indices, minlength=counts.shape[1]
+    )
+    absent_idf = np.log((num_documents + 1) / (paragraph_document_frequencies + 1)) + 1
+    present_idf = np.log((num_documents + 1) / (paragraph_document_frequencies + 2)) + 1
+
+    # The cosine similarity of question q and paragraph p is:
+    # sum_t(q_t * p_t * idf_t^2) / (|q * idf| * |p * idf|), with the idf of q's corpus.
+    # Only the terms of q, which use present_idf, contribute to the numerator and |q * idf|,
+    # and |p * idf|^2 is its norm with absent_idf, corrected for the terms of q.
+    squared_paragraph_counts = paragraph_counts.multiply(paragraph_counts).tocsr()
+    numerators = (
+        question_counts @ scipy.sparse.diags(present_idf**2) @ paragraph_counts.T
+    ).toarray()
+    question_norms = np.sqrt(
+        question_counts.multiply(question_counts).tocsr() @ present_idf**2
+    )
+    paragraph_norms = np.sqrt(
+        (squared_paragraph_counts @ absent_idf**2)[None, :]
+        + (
+            (question_counts > 0).astype(np.float64)
+            @ scipy.sparse.diags(present_idf**2 - absent_idf**2)
+            @ squared_paragraph_counts.T
+        ).toarray()
+    )
+    denominators = question_norms[:, None] * paragraph_norms
+    cosine_similarities = np.divide(
+        numerators,
+        denominators,
+        out=np.zeros_like(numerators),
+        where=denominators > 0,
+    )
+
+    orders = []
+    for question, question_similarities in zip(questions, cosine_similarities):
+        # Stable sort reversed, same as sorted + [::-1], so ties are in reverse order.
+        idx = np.argsort(question_similarities, kind="stable")[::-1]
+        sorted_similarities = question_similarities[idx]
+        for index in np.nonzero(np.diff(sorted_similarities) > -NEAR_TIE_TOLERANCE)[0]:
+            # Exact zeros (no common terms) and copies of a paragraph tie in both.
+            if sorted_similarities[index] == 0.0 or (
+                paragraph_texts[idx[index]] == paragraph_texts[idx[index + 1]]
+            ):
+                continue
+            orders.append(get_order_by_tf_idf(question, order_to_paragraph_texts))
+            break
+        else:
+            orders.append([sorted_order[index] for index in idx])
+    return orders
+
+
+raw_data_directory = "raw_target_datasets"
+processed_data_directory = "processed_target_datasets"
+
+input_directory = os.path.join(raw_data_directory, "tatqa")
+output_directory = os.path.join(processed_data_directory, "tatqa")
+
+SET_NAMES = ["train", "dev", "test"]
+
+
+def get_passage_id(data_object: Dict) -> str:
+    # The string is hashed by the (dill-free) fast path of hash_object, which gives the same
+    # ids as before it existed. migrate_tatqa_passage_ids.py can verify or remap old files.
+    return hash_object(
+        data_object["table"]["uid"]
+        + " ".join(
+            [
+                e["uid"]
+                for e in sorted(data_object["paragraphs"], key=lambda e: e["order"])
+            ]
+        )
+    )
+
+
+def get_input_filepaths(set_name: str) -> List[str]:
+    return [os.path.join(input_directory, f"tatqa_dataset_{set_name}.json")]
+
+
+def process(set_name: str, chunk_index: int = 0, num_chunks: int = 1) -> List[Dict]:
+
+    processed_instances = []
+
+    (input_filepath,) = get_input_filepaths(set_name)
+
+    data_objects = read_json(input_filepath)
+    start, end = get_chunk_bounds(len(data_objects), chunk_index, num_chunks)
+
+    for data_object in tqdm(data_objects[start:end]):
+
+        table = data_object["table"]
+        paragraphs = data_object["paragraphs"]
+        questions = data_object["questions"]
+
+        table_text = f" {DF_COL_DELIMITER} ".join(
+            [
+                f" {DF_ROW_DELIMITER} ".join([e.strip() for e in row_object])
+                for row_object in table["table"]
+            ]
+        )
+
+        order_to_paragraph_texts = {
+            paragraph["order"]: paragraph["text"] for paragraph in paragraphs
+        }
+
+        passage_id = get_passage_id(data_object)
+        sorted_orders = get_orders_by_tf_idf(
+            [question["question"] for question in questions], order_to_paragraph_texts
+        )
+        for question, sorted_order in zip(questions, sorted_orders):
+
+            question_id = question["uid"]
+            question_text = question["question"]
+
+            local_paragraph_text = " ".join(
+                [order_to_paragraph_texts[order] for order in sorted_order]
             )
 
-            order_to_paragraph_texts = {
-                paragraph["order"]: paragraph["text"] for paragraph in paragraphs
-            }
+            context_text = f"TABLE: {table_text}  PARAGRAPH: {local_paragraph_text}"
 
-            passage_id = hash_object(
-                table["uid"]
-                + " ".join(
-                    [e["uid"] for e in sorted(paragraphs, key=lambda e: e["order"])]
-                )
-            )
-            for question in questions:
+            if set_name != "test":
 
-                question_id = question["uid"]
-                question_text = question["question"]
+                answer_type = question["answer_type"]
+                scale = question["scale"]
 
-                sorted_order = get_order_by_tf_idf(
-                    question_text, order_to_paragraph_texts
-                )
-                local_paragraph_text = " ".join(
-                    [order_to_paragraph_texts[order] for order in sorted_order]
-                )
+                if isinstance(question["answer"], (list, tuple)):
+                    answer_list = [
+                        str(answer).strip() + " " + scale.strip()
+                        for answer in question["answer"]
+                    ]
+                elif isinstance(question["answer"], (int, float, str)):
+                    answer_list = [
+                        str(question["answer"]).strip() + " " + scale.strip()
+                    ]
+                else:
+                    raise Exception("Unknown answer type.")
 
-                context_text = f"TABLE: {table_text}  PARAGRAPH: {local_paragraph_text}"
+                answer_list = [e.strip() for e in answer_list]
 
-                if set_name != "test":
+            else:
 
-                    answer_type = question["answer_type"]
-                    scale = question["scale"]
+                answer_type = "span"
+                answer_list = []
 
-                    if isinstance(question["answer"], (list, tuple)):
-                        answer_list = [
-                            str(answer).strip() + " " + scale.strip()
-                            for answer in question["answer"]
-                        ]
-                    elif isinstance(question["answer"], (int, float, str)):
-                        answer_list = [
-                            str(question["answer"]).strip() + " " + scale.strip()
-                        ]
-                    else:
-                        raise Exception("Unknown answer type.")
+            processed_instance = {
+                "passage_id": passage_id,
+                "question_id": question_id,
+                "question_text": question_text,
+                "context_text": context_text,
+                "answer_list": answer_list,
+                "answer_type": answer_type,
+            }
 
-                    answer_list = [e.strip() for e in answer_list]
+            processed_instances.append(processed_instance)
 
-                else:
+    return processed_instances
 
-                    answer_type = "span"
-                    answer_list = []
 
-                processed_instance = {
-                    "passage_id": passage_id,
-                    "question_id": question_id,
-                    "question_text": question_text,
-                    "context_text": context_text,
-                    "answer_list": answer_list,
-                    "answer_type": answer_type,
-                }
+def write_processed_instances(set_name: str, processed_instances: List[Dict]) -> None:
+    os.makedirs(output_directory, exist_ok=True)
+    output_filepath = os.path.join(output_directory, f"{set_name}.jsonl")
+    write_jsonl(processed_instances, output_filepath)
 
-                processed_instances.append(processed_instance)
 
-        write_jsonl(processed_instances, output_filepath)
+def main():
+    for set_name in SET_NAMES:
+        print(f"Processing {set_name}")
+        write_processed_instances(set_name, process(set_name))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict
+
+import torch
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+from predict import (
+    DEFAULT_MAX_GENERATION_LENGTH,
+    QUANTIZE_OPTIONS,
+    _generate_predictions,
+    add_predicted_answers,
+    load_model,
+    load_tokenizer,
+    prepare_input_ids,
+    quantize_model,
+)
+
+
+class MicroBatcher:
+    """
+    Collects the instances of concurrent requests into batches of up to max_batch_size
+    instances, waiting at most max_wait_ms after the first one for others to arrive, and
+    runs them through the model in a single thread that owns it.
+    """
+
+    def __init__(
+        self,
+        tokenizer: AutoTokenizer,
+        model: AutoModelForSeq2SeqLM,
+        device: torch.device,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        max_generation_length: int = DEFAULT_MAX_GENERATION_LENGTH,
+        max_context_length: int = 600,
+        max_question_length: int = 100,
+    ) -> None:
+        self._tokenizer = tokenizer
+        self._model = model
+        self._device = device
+        self._max_batch_size = max_batch_size
+        self._max_wait_seconds = max_wait_ms / 1000
+        self._max_generation_length = max_generation_length
+        self._max_context_length = max_context_length
+        self._max_question_length = max_question_length
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def predict(self, instances: List[Dict]) -> List[List[str]]:
+        # Blocks till the predicted answers of all the instances are ready.
+        futures = []
+        for instance in instances:
+            future = Future()
+            self._queue.put((instance, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _next_batch(self) -> List:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self._max_wait_seconds
+        while len(batch) < self._max_batch_size:
+            remaining_seconds = deadline - time.perf_counter()
+            if remaining_seconds <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining_seconds))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            instances = [
+                {
+                    "question_text": instance["question_text"],
+                    "context_text": instance["context_text"],
+                }
+                for instance, _ in batch
+            ]
+            try:
+                input_ids = prepare_input_ids(
+                    self._tokenizer,
+                    instances,
+                    max_context_length=self._max_context_length,
+                    max_question_length=self._max_question_length,
+                )
+                generated_predictions = _generate_predictions(
+                    self._tokenizer,
+                    self._model,
+                    input_ids,
+                    device=self._device,
+                    max_length=self._max_generation_length,
+                )
+                add_predicted_answers(instances, generated_predictions)
+            except Exception as exception:
+                for _, future in batch:
+                    future.set_exception(exception)
+                continue
+            for instance, (_, future) in zip(instances, batch):
+                future.set_result(instance["predicted_answers"])
+
+
+def make_request_handler(micro_batcher: MicroBatcher) -> type:
+    class RequestHandler(BaseHTTPRequestHandler):
+        # POST /predict with {"question_text": ..., "context_text": ...} returns
+        # {"predicted_answers": [...]}. Multiple instances can also be sent at once as
+        # {"instances": [...]}, which returns {"predictions": [{"predicted_answers": [...]}]}.
+
+        def _send_json(self, status: int, obj: Dict) -> None:
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            else:
+                self._send_json(404, {"error": f"Unknown path: {self.path}"})
+
+        def do_POST(self) -> None:
+            if self.path != "/predict":
+                self._send_json(404, {"error": f"Unknown path: {self.path}"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                instances = request.get("instances", [request])
+                for instance in instances:
+                    if not isinstance(instance.get("question_text"), str) or not isinstance(
+                        instance.get("context_text"), str
+                    ):
+                        raise ValueError(
+                            "Each instance needs a question_text and a context_text string."
+                        )
+            except (ValueError, TypeError, AttributeError) as exception:
+                self._send_json(400, {"error": str(exception)})
+                return
+
+            try:
+                all_predicted_answers = micro_batcher.predict(instances)
+            except Exception as exception:
+                self._send_json(500, {"error": repr(exception)})
+                return
+
+            if "instances" in request:
+                self._send_json(
+                    200,
+                    {
+                        "predictions": [
+                            {"predicted_answers": predicted_answers}
+                            for predicted_answers in all_predicted_answers
+                        ]
+                    },
+                )
+            else:
+                self._send_json(200, {"predicted_answers": all_predicted_answers[0]})
+
+        def log_message(self, format: str, *args) -> None:
+            pass  # Logging every request would slow down the server under load.
+
+    return RequestHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one of the HF models over HTTP.")
+    parser.add_argument("hf_model_name_or_path", type=str, help="hf_model_name_or_path")
+    parser.add_argument("--host", type=str, help="host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="port", default=8000)
+    parser.add_argument(
+        "--max_batch_size",
+        type=int,
+        help="max number of instances (across requests) to run through the model at once.",
+        default=16,
+    )
+    parser.add_argument(
+        "--max_wait_ms",
+        type=float,
+        help="max time to wait for more instances after the first one of a batch arrives.",
+        default=10.0,
+    )
+    parser.add_argument(
+        "--max_generation_length",
+        type=int,
+        help="max_generation_length",
+        default=DEFAULT_MAX_GENERATION_LENGTH,
+    )
+    parser.add_argument(
+        "--use_fast_tokenizer", action="store_true", help="use_fast_tokenizer", default=False
+    )
+    parser.add_argument(
+        "--quantize", type=str, choices=QUANTIZE_OPTIONS, help="see predict.py", default=None
+    )
+    parser.add_argument(
+        "--low_cpu_mem_usage", action="store_true", help="see predict.py", default=False
+    )
+    parser.add_argument(
+        "--max_context_length", type=int, help="max_context_length", default=600
+    )
+    parser.add_argument(
+        "--max_question_length", type=int, help="max_question_length", default=100
+    )
+    args = parser.parse_args()
+
+    tokenizer = load_tokenizer(args.hf_model_name_or_path, use_fast=args.use_fast_tokenizer)
+    model = load_model(args.hf_model_name_or_path, low_cpu_mem_usage=args.low_cpu_mem_usage)
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    if args.quantize == "int8" and device.type != "cpu":
+        raise Exception("int8 quantization is only supported for cpu inference.")
+    model = quantize_model(model, args.quantize)
+    model.to(device)
+
+    micro_batcher = MicroBatcher(
+        tokenizer,
+        model,
+        device,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        max_generation_length=args.max_generation_length,
+        max_context_length=args.max_context_length,
+        max_question_length=args.max_question_length,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_request_handler(micro_batcher))
+    print(f"Serving {args.hf_model_name_or_path} on http://{args.host}:{args.port}/predict")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,25 @@
 import os
 import json
+import argparse
+from typing import Dict
 
 import pandas as pd
 
-from constants import ALL_MODEL_NAMES
+from constants import ALL_MODEL_NAMES, PREDICTION_TIMING_SUFFIX
 
 
-def main():
+def get_model_with_data_name(model_name: str, evaluation_name: str) -> str:
+    model_with_data_name = model_name
+    model_with_data_name += "-"
+    model_with_data_name += (
+        evaluation_name.replace("_dev", "").replace("_test", "").replace(
+            "_cs", ""
+        ).replace("_bpb", "").replace("_", "-")
+    )
+    return model_with_data_name
 
-    metric_type = "ans_f1" # choices: ans_em or ans_f1.
+
+def read_metric_values(evaluations_directory: str, metric_type: str) -> Dict:
 
     dataframe_dict = { # Order is according to Table 1.
         "model": [],
@@ -33,16 +44,10 @@ def main():
         dataframe_dict["model"].append(model_name)
         for evaluation_name in evaluation_names:
 
-            model_with_data_name = model_name
-            model_with_data_name += "-"
-            model_with_data_name += (
-                evaluation_name.replace("_dev", "").replace("_test", "").replace(
-                    "_cs", ""
-                ).replace("_bpb", "").replace("_", "-")
-            )
+            model_with_data_name = get_model_with_data_name(model_name, evaluation_name)
 
             metrics_file_path = os.path.join(
-                "evaluations", model_with_data_name + "__" + evaluation_name + ".json"
+                evaluations_directory, model_with_data_name + "__" + evaluation_name + ".json"
             )
             if not os.path.exists(metrics_file_path):
                 metric_value = "n/a"
@@ -58,9 +63,77 @@ def main():
                 metric_value = metrics[metric_type]
             dataframe_dict[evaluation_name].append(metric_value)
 
-    dataframe = pd.DataFrame.from_dict(dataframe_dict)
+    return dataframe_dict
+
+
+def read_instances_per_second(predictions_directory: str, model_name: str) -> Dict:
+    # Returns the prediction speed (as saved by predict.py) of each dataset.
+    evaluation_name_to_speed = {}
+    if not os.path.exists(predictions_directory):
+        return evaluation_name_to_speed
+    for file_name in os.listdir(predictions_directory):
+        if not file_name.endswith(PREDICTION_TIMING_SUFFIX):
+            continue
+        model_with_data_name, evaluation_name = file_name.replace(
+            PREDICTION_TIMING_SUFFIX, ""
+        ).split("__")
+        if model_with_data_name != get_model_with_data_name(model_name, evaluation_name):
+            continue
+        with open(os.path.join(predictions_directory, file_name), "r") as file:
+            timing = json.load(file)
+        if timing["num_instances"]:
+            evaluation_name_to_speed[evaluation_name] = timing["instances_per_second"]
+    return evaluation_name_to_speed
+
 
+def main():
+
+    parser = argparse.ArgumentParser(description="Summarize results.")
+    parser.add_argument(
+        "--variant",
+        type=str,
+        default=None,
+        help="compare the results of a variant (e.g. int8, see predict_all.py and "
+        "evaluate_all.py) with the original ones, in accuracy and speed.",
+    )
+    args = parser.parse_args()
+
+    metric_type = "ans_f1" # choices: ans_em or ans_f1.
+
+    dataframe_dict = read_metric_values("evaluations", metric_type)
     report_path = "results_report.txt"
+
+    if args.variant:
+        # Each cell is "<variant metric> (<difference from the original metric>)", and
+        # speedup is the average ratio of instances/s over the datasets predicted in both.
+        variant_dataframe_dict = read_metric_values(
+            os.path.join("evaluations", args.variant), metric_type
+        )
+        for evaluation_name in list(dataframe_dict.keys())[1:]:
+            dataframe_dict[evaluation_name] = [
+                value if "n/a" in (value, original_value)
+                else f"{value} ({round(value - original_value, 1):+})"
+                for value, original_value in zip(
+                    variant_dataframe_dict[evaluation_name], dataframe_dict[evaluation_name]
+                )
+            ]
+        dataframe_dict["speedup"] = []
+        for model_name in dataframe_dict["model"]:
+            speeds = read_instances_per_second("predictions", model_name)
+            variant_speeds = read_instances_per_second(
+                os.path.join("predictions", args.variant), model_name
+            )
+            speedups = [
+                variant_speeds[evaluation_name] / speeds[evaluation_name]
+                for evaluation_name in variant_speeds.keys() & speeds.keys()
+            ]
+            dataframe_dict["speedup"].append(
+                f"{sum(speedups) / len(speedups):.2f}x" if speedups else "n/a"
+            )
+        report_path = f"results_report_{args.variant}.txt"
+
+    dataframe = pd.DataFrame.from_dict(dataframe_dict)
+
     print(
         f"Saving report in {report_path} "
         f"(Best viewed in an editor with wordwrapping disabled)."
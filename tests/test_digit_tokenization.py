@@ -0,0 +1,144 @@
+# Checks that the fast tokenizers with digit tokenization give the same token ids and
+# decoded texts as the slow ones. The T5 and Bart tokenizers are trained here on a tiny
+# corpus, with the digits as additional special tokens like in the TeaBReaC models,
+# so that it runs offline. benchmark_scripts/digit_tokenization_parity.py checks the
+# actual models on the processed datasets.
+import os
+import random
+
+import pytest
+
+pytest.importorskip("sentencepiece")
+pytest.importorskip("tokenizers")
+pytest.importorskip("transformers")
+
+import sentencepiece
+from tokenizers import ByteLevelBPETokenizer
+from transformers import AutoTokenizer, BartTokenizer, T5Tokenizer
+
+from digit_tokenization import enable_digit_tokenization
+
+
+DIGITS = [str(digit) for digit in range(10)]
+
+WORDS = (
+    "the score was in of and how many yards did touchdown field goal percent "
+    "million thousand quarter team first second points between longest shortest"
+).split()
+
+TEXTS = [
+    "In 1995 , the score was 21-14 .",
+    "answer_me: How many yards? context: 3 <extra_id_0>  4 5",
+    "<mask> 12 <mask>  7",
+    "  1  2  ",
+    "a<mask>b 9</s>x",
+    "tab\t3\tnewline\n4\n <pad> end",
+    "1,234 and 3.5% of the 12th (7) ",
+    "answer_me: 12 <ss> 30\ncontext: 4th quarter",
+    "x <extra_id_1>y<extra_id_2> 8 ",
+    "<s> 5 </s> 6",
+    "1<mask>2 <mask>3<mask> 4",
+    "é 10 Ω 200 million",
+]
+
+
+def get_corpus():
+    random.seed(13370)
+    return [
+        " ".join(
+            random.choice(WORDS + [str(random.randint(0, 5000)), "1,234", "3.5%", "(7)"])
+            for _ in range(random.randint(5, 20))
+        )
+        for _ in range(2000)
+    ]
+
+
+def build_t5_tokenizer(directory: str) -> None:
+    corpus_path = os.path.join(directory, "corpus.txt")
+    with open(corpus_path, "w") as file:
+        file.write("\n".join(get_corpus()))
+    sentencepiece.SentencePieceTrainer.train(
+        input=corpus_path,
+        model_prefix=os.path.join(directory, "spiece"),
+        vocab_size=300,
+        pad_id=0,
+        eos_id=1,
+        unk_id=2,
+        bos_id=-1,
+    )
+    extra_ids = [f"<extra_id_{index}>" for index in range(100)]
+    tokenizer = T5Tokenizer(
+        os.path.join(directory, "spiece.model"),
+        extra_ids=100,
+        additional_special_tokens=extra_ids + DIGITS,
+    )
+    tokenizer.save_pretrained(directory)
+
+
+def build_bart_tokenizer(directory: str) -> None:
+    bpe_tokenizer = ByteLevelBPETokenizer()
+    bpe_tokenizer.train_from_iterator(
+        get_corpus(),
+        vocab_size=600,
+        special_tokens=["<s>", "<pad>", "</s>", "<unk>", "<mask>"],
+    )
+    bpe_tokenizer.save_model(directory)
+    tokenizer = BartTokenizer(
+        os.path.join(directory, "vocab.json"),
+        os.path.join(directory, "merges.txt"),
+        additional_special_tokens=DIGITS,
+    )
+    tokenizer.save_pretrained(directory)
+
+
+@pytest.fixture(scope="module", params=["t5", "bart"])
+def tokenizers(request, tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp(request.param))
+    if request.param == "t5":
+        build_t5_tokenizer(directory)
+    else:
+        build_bart_tokenizer(directory)
+    # Also saves its tokenizer.json, as in the hub models, so that the fast tokenizer
+    # is loaded from it (with its own added token flags) rather than converted.
+    AutoTokenizer.from_pretrained(directory, use_fast=True).save_pretrained(directory)
+
+    slow_tokenizer = AutoTokenizer.from_pretrained(directory, use_fast=False)
+    fast_tokenizer = AutoTokenizer.from_pretrained(directory, use_fast=True)
+    assert fast_tokenizer.is_fast
+    enable_digit_tokenization(slow_tokenizer)
+    enable_digit_tokenization(fast_tokenizer)
+    return slow_tokenizer, fast_tokenizer
+
+
+def test_input_ids_match(tokenizers):
+    slow_tokenizer, fast_tokenizer = tokenizers
+    assert fast_tokenizer(TEXTS)["input_ids"] == slow_tokenizer(TEXTS)["input_ids"]
+    for text in TEXTS:
+        assert fast_tokenizer(text)["input_ids"] == slow_tokenizer(text)["input_ids"]
+
+
+def test_truncated_input_ids_match(tokenizers):
+    slow_tokenizer, fast_tokenizer = tokenizers
+    text = " ".join(TEXTS[:3] + get_corpus()[:20])
+    assert (
+        fast_tokenizer(text, truncation=True, max_length=50)["input_ids"]
+        == slow_tokenizer(text, truncation=True, max_length=50)["input_ids"]
+    )
+
+
+@pytest.mark.parametrize("skip_special_tokens", [False, True])
+def test_decoded_texts_match(tokenizers, skip_special_tokens):
+    slow_tokenizer, fast_tokenizer = tokenizers
+    input_ids = slow_tokenizer(TEXTS)["input_ids"]
+    slow_decoded_texts = slow_tokenizer.batch_decode(
+        input_ids, skip_special_tokens=skip_special_tokens
+    )
+    fast_decoded_texts = fast_tokenizer.batch_decode(
+        input_ids, skip_special_tokens=skip_special_tokens
+    )
+    assert fast_decoded_texts == slow_decoded_texts
+    assert [
+        fast_tokenizer.fix_decoded_text(decoded_text) for decoded_text in fast_decoded_texts
+    ] == [
+        slow_tokenizer.fix_decoded_text(decoded_text) for decoded_text in slow_decoded_texts
+    ]